@@ -1,12 +1,45 @@
+import argparse
 import logging
+import sys
 
 from app.core import constants
-from app.window import Window
 
 log = logging.getLogger(__name__)
 
-# Initialize the window.
-window = Window(constants.window.size, constants.window.title)
-log.info("Window initialized")
 
-window.run()
+def main() -> None:
+    """Runs the command given on the command line, or the window."""
+    parser = argparse.ArgumentParser(prog="python -m app", description=constants.window.title)
+    commands = parser.add_subparsers(dest="command")
+
+    analyze_parser = commands.add_parser("analyze", help="analyse audio files into the cache without a display")
+    analyze_parser.add_argument("paths", nargs="+", help="audio files or directories to analyse")
+    analyze_parser.add_argument("-j", "--jobs", type=int, default=0, help="worker processes, defaults to the cores")
+
+    play_parser = commands.add_parser("play", help="play an audio file and drive the servos without a window")
+    play_parser.add_argument("path", help="audio file to play")
+
+    args = parser.parse_args()
+
+    if args.command == "analyze":
+        from app.cli import analyze
+
+        sys.exit(analyze(args.paths, args.jobs))
+
+    if args.command == "play":
+        from app.headless import play
+
+        sys.exit(play(args.path))
+
+    from app.window import Window
+
+    # Initialize the window.
+    window = Window(constants.window.size, constants.window.title)
+    log.info("Window initialized")
+
+    window.run()
+
+
+# Worker processes import this module too, they must not open a window.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, Set, Tuple
+
+import numpy as np
+
+from app.core import constants, settings
+from app.utils import analysis
+
+log = logging.getLogger(__name__)
+
+# Bump when the layout of `manifest.json` or `spectrogram.npy` changes.
+CACHE_VERSION = 2
+
+# Files are hashed with large reads, the index remembers hashes of unchanged files.
+HASH_BUFFER_SIZE = 1024 * 1024
+LEGACY_KEY = re.compile(r"[0-9a-f]{32}")
+
+try:
+    import fcntl
+
+    # Linux ioctl cloning a file's extents on copy-on-write filesystems.
+    FICLONE = 0x40049409
+except ModuleNotFoundError:
+    fcntl = None
+
+
+def hash_file(file_path: str, legacy: bool = False) -> Tuple[str, str]:
+    """Hashes a file with blake2b, and md5 as well for caches created before the index."""
+    file_hash = hashlib.blake2b(digest_size=16)
+    legacy_hash = hashlib.md5() if legacy else None
+
+    buffer = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as f:
+        while size := f.readinto(buffer):
+            file_hash.update(view[:size])
+            if legacy_hash:
+                legacy_hash.update(view[:size])
+
+    return file_hash.hexdigest(), legacy_hash.hexdigest() if legacy_hash else ""
+
+
+def link_or_copy(source: str, destination: str) -> None:
+    """Hardlinks or reflinks a file when the filesystem allows it, and copies it otherwise."""
+    try:
+        os.link(source, destination)
+        return
+    except OSError:
+        pass
+
+    if fcntl:
+        try:
+            with open(source, "rb") as src, open(destination, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return
+        except OSError:
+            pass
+
+    shutil.copyfile(source, destination)
+
+
+class CacheManager:
+    """Keeps the analysis cache and its recent files under a byte budget, evicting the least recently used."""
+
+    def __init__(self, cache_path: str = settings.cache_path, size_limit: int = settings.cache_size_limit):
+        self.cache_path = cache_path
+        self.size_limit = size_limit
+        self.lock = threading.Lock()
+
+    def load(self) -> dict:
+        """Loads the index of file stats and cache entries."""
+        try:
+            with open(f"{self.cache_path}/index.json", "r") as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            index = {}
+
+        index.setdefault("files", {})
+        if "entries" not in index:
+            index["entries"] = self.scan()
+
+            # Caches created before the index are keyed by the md5 of their file, until they are renamed.
+            index["legacy"] = [key for key in index["entries"] if LEGACY_KEY.fullmatch(key)]
+
+        index.setdefault("legacy", [])
+        return index
+
+    def save(self, index: dict) -> None:
+        """Saves the index atomically."""
+        if not os.path.exists(self.cache_path):
+            os.makedirs(self.cache_path)
+
+        tmp = f"{self.cache_path}/index.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, f"{self.cache_path}/index.json")
+
+    def scan(self) -> Dict[str, dict]:
+        """Gets entries for cache directories created before the index."""
+        if not os.path.isdir(self.cache_path):
+            return {}
+
+        entries = {}
+        for name in os.listdir(self.cache_path):
+            if name in ("default", "recent") or not os.path.isdir(f"{self.cache_path}/{name}"):
+                continue
+
+            entries[name] = {
+                "size": self.entry_size(name, ""),
+                "last_access": os.path.getmtime(f"{self.cache_path}/{name}"),
+                "recent": ""
+            }
+
+        return entries
+
+    def entry_size(self, key: str, recent: str) -> int:
+        """Gets the bytes used by a cache directory and its recent file."""
+        size = 0
+        for entry in os.scandir(f"{self.cache_path}/{key}"):
+            size += entry.stat().st_size
+
+        # Hardlinks share their blocks with the original file.
+        if recent and os.path.exists(f"{self.cache_path}/recent/{recent}"):
+            stat = os.stat(f"{self.cache_path}/recent/{recent}")
+            if stat.st_nlink == 1:
+                size += stat.st_size
+
+        return size
+
+    def get_key(self, file_path: str) -> str:
+        """Gets the cache key of a file, it is only hashed when its stat changed since it was last seen."""
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "inode": stat.st_ino}
+
+        with self.lock:
+            index = self.load()
+
+        entry = index["files"].get(file_path)
+        if entry and all(entry.get(k) == v for k, v in signature.items()):
+            return entry["key"]
+
+        # Caches keyed by md5 that were found when the index was created can be renamed instead of analysed again.
+        legacy = any(os.path.isdir(f"{self.cache_path}/{name}") for name in index["legacy"])
+
+        key, legacy_key = hash_file(file_path, legacy)
+        legacy_dir, cache_dir = f"{self.cache_path}/{legacy_key}", f"{self.cache_path}/{key}"
+        if legacy_key and os.path.isdir(legacy_dir) and not os.path.exists(cache_dir):
+            os.rename(legacy_dir, cache_dir)
+            log.info(f"Renamed md5 cache {legacy_key} to {key}")
+
+        with self.lock:
+            index = self.load()
+            index["files"][file_path] = {**signature, "key": key}
+
+            if legacy_key in index["entries"]:
+                index["entries"][key] = index["entries"].pop(legacy_key)
+
+            index["legacy"] = [name for name in index["legacy"] if os.path.isdir(f"{self.cache_path}/{name}")]
+            self.save(index)
+
+        return key
+
+    def touch(self, key: str) -> None:
+        """Marks a cache entry as used now."""
+        with self.lock:
+            index = self.load()
+            if key in index["entries"]:
+                index["entries"][key]["last_access"] = time.time()
+                self.save(index)
+
+    def add(self, key: str, file_path: str, protected: Iterable[str] = (), recent: bool = True) -> None:
+        """Records a written cache entry, links its file into the recent directory if asked and evicts over budget."""
+        name = os.path.basename(file_path) if recent else ""
+        if recent:
+            self.link_recent(file_path)
+
+        with self.lock:
+            index = self.load()
+
+            # A recent file with the same name replaces the previous one.
+            for entry in index["entries"].values():
+                if name and entry["recent"] == name:
+                    entry["recent"] = ""
+
+            index["entries"][key] = {
+                "size": self.entry_size(key, name),
+                "last_access": time.time(),
+                "recent": name
+            }
+            self.evict(index, {key, *protected})
+            self.save(index)
+
+    def link_recent(self, file_path: str) -> None:
+        """Links a file into the recent directory, replacing a file with the same name."""
+        recent_dir = f"{self.cache_path}/recent"
+        if not os.path.exists(recent_dir):
+            os.makedirs(recent_dir)
+
+        destination = f"{recent_dir}/{os.path.basename(file_path)}"
+        if os.path.exists(destination) and os.path.samefile(file_path, destination):
+            log.debug(f"{file_path} is already in recent directory")
+            return
+
+        if os.path.exists(destination):
+            os.remove(destination)
+
+        link_or_copy(file_path, destination)
+        log.info(f"Linked {file_path} to recent directory")
+
+    def evict(self, index: dict, protected: Set[str]) -> None:
+        """Removes the least recently used entries until the cache fits in its budget."""
+        total = sum(entry["size"] for entry in index["entries"].values())
+        for key, entry in sorted(index["entries"].items(), key=lambda item: item[1]["last_access"]):
+            if total <= self.size_limit:
+                break
+
+            if key in protected:
+                continue
+
+            # The profile is kept, it is tiny and holds the user's settings for the track.
+            for name in ("manifest.json", "spectrogram.npy", "spectrogram.xz", "ratios.json"):
+                if os.path.exists(f"{self.cache_path}/{key}/{name}"):
+                    os.remove(f"{self.cache_path}/{key}/{name}")
+
+            if entry["recent"] and os.path.exists(f"{self.cache_path}/recent/{entry['recent']}"):
+                os.remove(f"{self.cache_path}/recent/{entry['recent']}")
+
+            total -= entry["size"]
+            del index["entries"][key]
+            log.info(f"Evicted cache entry {key}")
+
+
+def save_spectrogram(cache_dir: str, spectrogram: np.ndarray, ratios: dict) -> None:
+    """Saves a spectrogram and its ratios to the given cache directory."""
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    # Write to temporary files first, the manifest is written last so its presence marks a complete cache.
+    np.save(f"{cache_dir}/spectrogram.tmp.npy", np.ascontiguousarray(spectrogram))
+    os.replace(f"{cache_dir}/spectrogram.tmp.npy", f"{cache_dir}/spectrogram.npy")
+
+    with open(f"{cache_dir}/manifest.tmp.json", "w") as f:
+        json.dump({
+            "version": CACHE_VERSION,
+            "spectrogram": {
+                "file": "spectrogram.npy",
+                "dtype": str(spectrogram.dtype),
+                "shape": list(spectrogram.shape)
+            },
+            "frequencies": [int(freq) for freq in analysis.bar_frequencies()],
+            "ratios": ratios
+        }, f)
+    os.replace(f"{cache_dir}/manifest.tmp.json", f"{cache_dir}/manifest.json")
+
+
+def load_spectrogram(cache_dir: str) -> Tuple[np.ndarray, dict]:
+    """Loads a memory mapped spectrogram and its ratios from the given cache directory."""
+    if not os.path.exists(f"{cache_dir}/manifest.json"):
+        migrate(cache_dir)
+
+    with open(f"{cache_dir}/manifest.json", "r") as f:
+        manifest = json.load(f)
+
+    if manifest.get("version") != CACHE_VERSION:
+        raise ValueError(f"Unsupported cache version {manifest.get('version')}")
+
+    if manifest["frequencies"] != [int(freq) for freq in analysis.bar_frequencies()]:
+        raise ValueError("Cache was analysed for different frequencies")
+
+    # Only the pages that are read get loaded from the disk.
+    spectrogram = np.load(f"{cache_dir}/{manifest['spectrogram']['file']}", mmap_mode="r")
+    if list(spectrogram.shape) != manifest["spectrogram"]["shape"]:
+        raise ValueError("Cache spectrogram does not match its manifest")
+
+    return spectrogram, manifest["ratios"]
+
+
+def migrate(cache_dir: str) -> None:
+    """Converts a gzip and pickle cache to the current format."""
+    if not os.path.exists(f"{cache_dir}/spectrogram.xz"):
+        raise FileNotFoundError(f"No cache found in {cache_dir}")
+
+    with gzip.open(f"{cache_dir}/spectrogram.xz", "rb") as f:
+        spectrogram = pickle.load(f)
+
+    with open(f"{cache_dir}/ratios.json", "r") as f:
+        ratios = json.load(f)
+
+    frequencies = analysis.bar_frequencies()
+    if spectrogram.dtype != np.int8:
+        # Full (bins, frames) spectrogram in decibels relative to the track's loudest bin.
+        bins = spectrogram.shape[0]
+        sample_rate = round(2 * bins / ratios["frequencies_index_ratio"])
+        matrix = analysis.band_matrix(sample_rate, frequencies, (bins - 1) * 2)
+
+        # Bins at the old -80 dB floor are silent, so they do not add up to a louder floor.
+        power = np.where(spectrogram > spectrogram.min(), np.power(10, spectrogram / 10, dtype=np.float32), 0)
+        with np.errstate(divide="ignore"):
+            db = 10 * np.log10(power.T @ matrix)
+
+        spectrogram = np.clip(np.rint(db), constants.visualizer.default_db, np.iinfo(np.int8).max).astype(np.int8)
+
+    ratios["frequencies_index_ratio"] = 1 / constants.visualizer.frequency_step
+    save_spectrogram(cache_dir, spectrogram, ratios)
+
+    os.remove(f"{cache_dir}/spectrogram.xz")
+    os.remove(f"{cache_dir}/ratios.json")
+    log.info(f"Migrated cache in {cache_dir} to version {CACHE_VERSION}")
+
+
+cache_manager = CacheManager()
@@ -0,0 +1,88 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, Iterator, List, Tuple
+
+from app.cache import cache_manager, load_spectrogram, save_spectrogram
+from app.core import constants, settings
+from app.utils import analysis
+
+log = logging.getLogger(__name__)
+
+
+def find_audio_files(paths: Iterable[str]) -> Iterator[str]:
+    """Finds the supported audio files in the given files and directories."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                if name.rsplit(".", 1)[-1].lower() in constants.audio.supported_formats:
+                    yield os.path.join(root, name)
+
+
+def analyse_file(file_path: str, cache_dir: str) -> Tuple[float, float]:
+    """Analyses a file into its cache directory, returning the audio duration and the time it took."""
+    start = time.perf_counter()
+    spectrogram, ratios = analysis.analyse(file_path)
+    save_spectrogram(cache_dir, spectrogram, ratios)
+
+    return len(spectrogram) / ratios["time_index_ratio"], time.perf_counter() - start
+
+
+def analyze(paths: List[str], jobs: int = 0) -> int:
+    """Analyses every audio file in the given paths across a process pool, returning the exit code."""
+    files = list(find_audio_files(paths))
+    pending, analysed, skipped, failed = {}, 0, 0, 0
+
+    # Keys are computed here so only this process writes the cache index.
+    for file_path in files:
+        try:
+            key = cache_manager.get_key(file_path)
+        except OSError as e:
+            log.error(f"Could not read {file_path}: {e}")
+            failed += 1
+            continue
+
+        try:
+            load_spectrogram(f"{settings.cache_path}/{key}")
+            skipped += 1
+        except (FileNotFoundError, ValueError, EOFError):
+            pending[file_path] = key
+
+    log.info(f"Analysing {len(pending)} files, {skipped} already cached")
+
+    start, audio_seconds = time.perf_counter(), 0
+    with ProcessPoolExecutor(jobs or os.cpu_count()) as executor:
+        futures = {
+            executor.submit(analyse_file, file_path, f"{settings.cache_path}/{key}"): file_path
+            for file_path, key in pending.items()
+        }
+
+        for done, future in enumerate(as_completed(futures), 1):
+            file_path = futures[future]
+            try:
+                duration, seconds = future.result()
+            except Exception as e:
+                log.error(f"[{done}/{len(futures)}] Failed to analyse {file_path}: {e!r}")
+                failed += 1
+                continue
+
+            # Library files stay out of the recent directory, copies of them would use the cache budget.
+            cache_manager.add(pending[file_path], file_path, recent=False)
+            audio_seconds += duration
+            analysed += 1
+            log.info(
+                f"[{done}/{len(futures)}] Analysed {os.path.basename(file_path)} in {seconds:.1f}s "
+                f"({duration / max(seconds, 1e-6):.1f}x realtime)"
+            )
+
+    elapsed = time.perf_counter() - start
+    log.info(
+        f"Analysed {analysed} files ({audio_seconds / 60:.1f} minutes of audio) in {elapsed:.1f}s, "
+        f"{audio_seconds / max(elapsed, 1e-6):.1f}x realtime, {skipped} skipped, {failed} failed"
+    )
+    return 1 if failed else 0
@@ -1,84 +1,214 @@
 import logging
 import time
-from typing import List, Tuple
+from typing import List, Optional, Sequence, Tuple
 
-import serial.tools.list_ports
+import numpy as np
+import pygame
 from pygame import Surface
-from serial import Serial
+from serial import SerialException
+from serial.tools import list_ports
 
 from app.core import constants
-from app.state import pool
+from app.link import Board, find_ports
+from app.state import pool, state
+from app.utils import protocol
+from app.utils.arduino import rotation_table
+from app.utils.ui import text_cache
 
 log = logging.getLogger(__name__)
 
 
 class Arduino:
-    """Represents the arduino board UI."""
+    """Represents the arduino boards UI."""
 
     def __init__(self, pos: Tuple[int, int]):
         self.pos = pos
         self.port, self.ports = "", []
 
-        self.serial = None
+        # Connected boards, in the order channels number them.
+        self.boards: List[Board] = []
         self.multiple_ports = False
+        self.closed = False
+
+        # When to look again for the boards the channels use but are not connected.
+        self.search_at = 0.0
+
+        # Telemetry.
+        self.reconnects = 0
+        self.show_telemetry = False
+
+        # The lines shown, rendered once they change, and where the panel is drawn.
+        self.lines: List[str] = []
+        self.surface: Optional[Surface] = None
+        self.panel = pygame.Rect(pos, (0, 0))
 
         self.p = pool.submit(self.try_get_ports)
 
-    def get_ports(self) -> None:
-        """Returns the port of the arduino."""
-        ports = list(serial.tools.list_ports.comports())
-        if not ports:
-            self.refresh([])
-            return
-        elif len(ports) > 1:
+    def get_ports(self) -> bool:
+        """Connects the arduino boards plugged in, returns whether any was found."""
+        known, unknown = find_ports()
+        if len(known) + len(unknown) > 1:
             self.multiple_ports = True
-            log.warning("Multiple ports found, using the first one")
 
-        self.refresh([port.device for port in ports])
+        return self.refresh(known, unknown)
+
+    def refresh(self, known: List[str], unknown: Sequence[str] = ()) -> bool:
+        """Connects a board for every board number the channels use and no board has, known arduino ports first."""
+        count = max(channel.board for channel in state.get_channels()) + 1
+        boards = list(self.boards)
+        for port in [*known, *unknown]:
+            if len(boards) >= count:
+                break
 
-    def refresh(self, ports: List[str]) -> None:
-        """Refresh the serial."""
-        try:
-            # Initialize serial.
-            self.serial = Serial(ports[0], constants.audio.baud_rate, timeout=1)
-            time.sleep(1)
+            # The connected boards keep their ports and numbers.
+            if port in self.ports:
+                continue
 
-            self.port = ports[0]
-            self.ports = ports
-            log.info(f"Connected to arduino board at port {self.port}")
-        except KeyError:
-            log.debug("No ports found")
-            self.serial = None
+            try:
+                boards.append(Board(port, port in known))
+            except (SerialException, OSError) as e:
+                log.debug(f"Could not connect to {port}: {e}")
+
+        if not boards:
+            log.debug("No arduino board found")
+            return False
+
+        self.boards = boards
+        self.ports = [board.port for board in boards]
+        self.port = self.ports[0]
+        return True
 
     def try_get_ports(self) -> None:
-        """Try to detect arduino port in a loop."""
-        while not self.port:
-            self.get_ports()
-            time.sleep(3)
+        """Try to detect arduino boards, backing off after failures and retrying at once when a port appears."""
+        delay, maximum = constants.arduino.backoff
+        while not self.closed and not self.get_ports():
+            ports = list_ports.comports()
+            deadline = time.monotonic() + delay
+            delay = min(delay * 2, maximum)
+
+            while not self.closed and time.monotonic() < deadline:
+                time.sleep(constants.arduino.hotplug_interval)
+                if list_ports.comports() != ports:
+                    delay = constants.arduino.backoff[0]
+                    break
 
         self.p = None
 
+    def reconnect(self, lost: List[Board]) -> None:
+        """Closes the boards of a lost connection and looks for boards again."""
+        for board in lost:
+            board.close()
+
+        self.try_get_ports()
+
+    def close(self) -> None:
+        """Stops looking for boards and disconnects them."""
+        self.closed = True
+        for board in self.boards:
+            board.close()
+
+        self.boards = []
+
     def update(self) -> None:
         """Updates the handle's angle."""
         pass
 
+    def get_telemetry(self) -> dict:
+        """Gets the connection counters and the statistics of every board's link."""
+        return {
+            "reconnects": self.reconnects,
+            "boards": [
+                {"port": board.port, "baud_rate": board.baud_rate, **board.link.get_stats()} for board in self.boards
+            ]
+        }
+
+    def get_lines(self) -> List[str]:
+        """Gets the lines of the telemetry panel."""
+        telemetry = self.get_telemetry()
+        lines = [f"Reconnects {telemetry['reconnects']}" if self.boards else "No arduino board connected"]
+        for board in telemetry["boards"]:
+            round_trip = board["round_trip"]
+            lines += [
+                f"{board['port']} at {board['baud_rate']} baud",
+                f"RTT p50 {round_trip['p50']:.1f} ms, p90 {round_trip['p90']:.1f} ms, p99 {round_trip['p99']:.1f} ms",
+                f"{board['bytes_per_second']:.0f} B/s, {board['commands_per_second']:.0f} commands/s, "
+                f"write {board['latency_mean']:.2f} ms",
+                f"Checksum errors {board['checksum_errors']} in, {board['board_checksum_errors']} out, "
+                f"{board['coalesced']} coalesced"
+            ]
+
+        return lines
+
+    def get_dirty(self) -> List[pygame.Rect]:
+        """Gets the regions of the telemetry panel, before and after, if it changed since the last frame."""
+        lines = self.get_lines() if self.show_telemetry else []
+        if lines == self.lines:
+            return []
+
+        previous, self.lines = self.panel, lines
+        self.surface = self.render_panel(lines) if lines else None
+        self.panel = self.surface.get_rect(topleft=self.pos) if self.surface else pygame.Rect(self.pos, (0, 0))
+        return [previous, self.panel]
+
+    def render_panel(self, lines: List[str]) -> Surface:
+        """Renders the lines over a translucent panel."""
+        size, color = constants.arduino.telemetry_font_size, constants.arduino.telemetry_color
+        texts = [text_cache.render(line, constants.visualizer.font, size, color) for line in lines]
+
+        padding = constants.arduino.telemetry_padding
+        width = max(text.get_width() for text in texts) + padding * 2
+        height = sum(text.get_height() for text in texts) + padding * 2
+        panel = Surface((width, height), pygame.SRCALPHA)
+        panel.fill(constants.arduino.telemetry_background)
+
+        y = padding
+        for text in texts:
+            panel.blit(text, (padding, y))
+            y += text.get_height()
+
+        return panel
+
     def render(self, screen: Surface) -> None:
-        """Renders the handle to the given surface."""
-        pass
+        """Renders the telemetry panel to the given surface, if it is shown."""
+        if self.show_telemetry and self.surface:
+            screen.blit(self.surface, self.pos)
+
+    def get_latency(self) -> float:
+        """Gets the seconds the rotations of a tick take to go through the slowest serial link."""
+        frames = np.bincount([channel.board for channel in rotation_table.channels], minlength=len(self.boards))
+        if not self.boards:
+            return protocol.transfer_time(int(frames.max(initial=1)), constants.arduino.baud_rate)
+
+        return max(board.get_latency(int(count)) for board, count in zip(self.boards, frames))
+
+    def send(self, rotations: np.ndarray) -> None:
+        """Sends the rotation of every channel to the arduino boards."""
+        if self.closed:
+            return
 
-    def send(self, rotation: int) -> None:
-        """Sends the given rotation to the arduino."""
         if not self.port:
             if not self.p or self.p.done():
                 self.port, self.ports = "", []
                 self.p = pool.submit(self.try_get_ports)
             return
 
-        try:
-            self.serial.write(bytes(f"servo,{rotation}\n", "utf-8"))
-        except serial.serialutil.SerialException:
-            self.serial = None
+        if not all(board.link.alive for board in self.boards):
+            # Closing a stalled port can block, the boards are closed in the pool before reconnecting.
+            lost, self.boards = self.boards, []
+            self.reconnects += 1
             self.port, self.ports = "", []
-            self.p = pool.submit(self.try_get_ports)
+            self.p = pool.submit(self.reconnect, lost)
 
             log.warning("Lost connection to arduino board")
+            return
+
+        # The channels of a new profile may use more boards than are connected, look for them now and then.
+        count = max((channel.board for channel in rotation_table.channels), default=0) + 1
+        if len(self.boards) < count and (not self.p or self.p.done()) and time.monotonic() >= self.search_at:
+            self.search_at = time.monotonic() + constants.arduino.backoff[1]
+            self.p = pool.submit(self.get_ports)
+
+        # The links write the latest rotations at their control rate, this never waits for a port.
+        for channel, rotation in zip(rotation_table.channels, rotations.tolist()):
+            if channel.board < len(self.boards):
+                self.boards[channel.board].link.put(channel.servo, rotation)
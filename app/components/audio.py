@@ -1,60 +1,71 @@
-import gzip
-import hashlib
-import json
 import logging
 import os
-import pickle
-import shutil
-import time
-from typing import Tuple
+from typing import List, Optional, Tuple
 
-import librosa
 import numpy as np
 import pygame
 from pygame import Surface
-from pygame.font import Font
 
+from app.cache import cache_manager, load_spectrogram
+from app.controller import Controller
 from app.core import constants, settings
+from app.live import LiveAnalyzer, MicrophoneSource, Source
 from app.state import pool, state
-from app.utils.arduino import get_rotation
-from app.utils.maths import clamp
-from app.utils.ui import prompt_file
+from app.timeline import Timeline
+from app.utils import analysis
+from app.utils.ui import DirtyRegion, prompt_file, text_cache
+from app.worker import AnalysisJob
 
 log = logging.getLogger(__name__)
 
 
-class AudioBar:
-    """Represents an audio bar in the audio visualizer."""
+class AudioBars:
+    """Represents the bars of the audio visualizer, their state is kept in arrays."""
+
+    __slots__ = (
+        "x", "y", "frequencies", "color", "width", "min_height", "max_height",
+        "min_decibel", "max_decibel", "decibel_height_ratio", "heights", "targets", "speeds"
+    )
 
     def __init__(
-            self, x: int, y: int, freq: int, color: Tuple[int, int, int],
+            self, x: int, y: int, frequencies: np.ndarray, color: Tuple[int, int, int],
             width: int = 50, min_height: int = 10, max_height: int = 100,
             min_decibel: int = constants.visualizer.default_db, max_decibel: int = 0
     ):
-        # Define the positions of the bar.
-        self.x, self.y, self.freq = x, y, freq
+        # Define the positions of the bars, side by side from `x`.
+        self.x = x + np.arange(len(frequencies)) * width
+        self.y, self.frequencies = y, frequencies
         self.color = color
 
-        # Define the geometry of the bar.
+        # Define the geometry of the bars.
         self.width, self.min_height, self.max_height = width, min_height, max_height
-        self.height = min_height
+        self.heights = np.full(len(frequencies), min_height, dtype=np.float32)
+        self.targets = np.zeros(len(frequencies), dtype=np.float32)
+        self.speeds = np.zeros(len(frequencies), dtype=np.float32)
 
         # Define required decibel ratios.
         self.min_decibel, self.max_decibel = min_decibel, max_decibel
         self.decibel_height_ratio = (self.max_height - self.min_height) / (self.max_decibel - self.min_decibel)
 
-    def update(self, dt: float, decibel: int) -> None:
-        """Updates the bar's height based on the given decibel value."""
-        desired_height = decibel * self.decibel_height_ratio + self.max_height
-        speed = (desired_height - self.height) / 0.1
+    def __len__(self) -> int:
+        return len(self.frequencies)
+
+    def update(self, dt: float, decibels: np.ndarray) -> None:
+        """Updates the bars' heights based on the given decibel values."""
+        np.multiply(decibels, self.decibel_height_ratio, out=self.targets)
+        self.targets += self.max_height
+
+        np.subtract(self.targets, self.heights, out=self.speeds)
+        self.speeds /= 0.1
 
-        # Update the bar's height.
-        self.height += speed * dt
-        self.height = clamp(self.min_height, self.max_height, self.height)
+        # Update the bars' heights.
+        self.heights += self.speeds * dt
+        np.clip(self.heights, self.min_height, self.max_height, out=self.heights)
 
     def render(self, surface: Surface) -> None:
-        """Renders the handle on the given surface."""
-        pygame.draw.rect(surface, self.color, (self.x, self.y + self.max_height - self.height, self.width, self.height))
+        """Renders the bars on the given surface."""
+        for x, height in zip(self.x.tolist(), self.heights.tolist()):
+            pygame.draw.rect(surface, self.color, (x, self.y + self.max_height - height, self.width, height))
 
 
 class AudioVisualizer:
@@ -76,8 +87,10 @@ class AudioVisualizer:
 
         # Required analysis variables.
         self.audio_file = AudioFile("")
-        self.bars = []
-        self.frequencies = np.arange(*constants.visualizer.frequency_range, 100)
+        self.frequencies = analysis.bar_frequencies()
+
+        # Live input analysis, replaces the audio file while it is enabled.
+        self.live: Optional[LiveAnalyzer] = None
 
         # Mouse.
         self.clicked = False
@@ -88,63 +101,170 @@ class AudioVisualizer:
         width = self.width // r
         x = (self.width - width * r) // 2
 
-        # Initialize the bars.
-        for c in self.frequencies:
-            self.bars.append(AudioBar(x, 0, c, constants.visualizer.bar_color, max_height=self.height, width=width))
-            x += width
+        self.bars = AudioBars(
+            x, 0, self.frequencies, constants.visualizer.bar_color, max_height=self.height, width=width
+        )
 
-        # Initialize arduino component.
+        # Initialize arduino component, and the controller driving it.
         self.arduino = arduino
+        self.controller = Controller(arduino)
 
         # Sizes.
         self.h_start, self.h_end = 0, self.height
         self.update_min_max(reverse=True)
 
+        # The bars with their border, and the slider with the cable on the left.
+        self.regions = (
+            DirtyRegion(self.rect.inflate(16, 16)),
+            DirtyRegion(pygame.Rect(0, 0, self.pos[0], constants.window.size[1]))
+        )
+
     def update_min_max(self, reverse: bool = False) -> None:
         """Updates the slider surface."""
-        ratio = self.bars[0].decibel_height_ratio
+        ratio = self.bars.decibel_height_ratio
 
         if reverse:
-            self.h_start = int(self.height - (state.max_dbfs * ratio + self.bars[0].max_height))
-            self.h_end = int(self.height - (state.min_dbfs * ratio + self.bars[0].max_height))
+            self.h_start = int(self.height - (state.max_dbfs * ratio + self.bars.max_height))
+            self.h_end = int(self.height - (state.min_dbfs * ratio + self.bars.max_height))
         else:
             # Reverse equation from height to decibel.
-            state.max_dbfs = int((self.height - self.bars[0].max_height - self.h_start) / ratio)
-            state.min_dbfs = int((self.height - self.bars[0].max_height - self.h_end) / ratio)
+            state.max_dbfs = int((self.height - self.bars.max_height - self.h_start) / ratio)
+            state.min_dbfs = int((self.height - self.bars.max_height - self.h_end) / ratio)
+
+    def handle_input(self) -> None:
+        """Handles the mouse every frame, whether or not the visualizer is redrawn."""
+        if self.audio_file.failed:
+            # Go back to the file prompt, there is nothing to play.
+            self.stop()
+
+        if not self.audio_file.file_path and not self.live:
+            if self.rect.collidepoint(state.mouse_pos) and state.holding_mouse:
+                # Prompt the user to select a file.
+                filename = str(prompt_file())
+                self.load_file(filename)
+
+        # Get top border and bottom border rect of the slider.
+        width = 75
+        top_border_rect = pygame.Rect(0, 0, width, 64)
+        top_border_rect.center = (
+            (self.pos[0] - width - 25 - 8) + (width // 2),
+            self.pos[1] + self.h_start
+        )
 
-    def update(self, dela_time: float) -> None:
-        """Updates the visualizer with the given data."""
-        db_average = 0
-        for b in self.bars:
-            # Update all the bars with available db.
-            db = self.audio_file.get_decibel(pygame.mixer.music.get_pos() / 1000.0, b.freq)
-            b.update(dela_time, db)
+        bottom_border_rect = pygame.Rect(0, 0, width, 64)
+        bottom_border_rect.center = (
+            (self.pos[0] - width - 25 - 8) + (width // 2),
+            self.pos[1] + self.h_end
+        )
+
+        # Check if mouse is in top border.
+        if top_border_rect.collidepoint(state.mouse_pos):
+            if state.holding_mouse:
+                current = self.pos[1] - 8 + self.h_start
+                add_h = state.mouse_pos[1] - current
+
+                if self.h_start + add_h < 0:
+                    add_h = 0 - self.h_start
 
-            db_average += db
+                if self.h_start + add_h + 70 <= self.h_end:
+                    self.h_start += add_h
+                    self.update_min_max()
 
-        if self.audio_file.started and not self.audio_file.paused:
-            # Calculate rotation based on db.
-            db_average /= len(self.bars)
-            rotation = get_rotation(db_average)
+        elif bottom_border_rect.collidepoint(state.mouse_pos):
+            if state.holding_mouse:
+                current = self.pos[1] - 8 + self.h_end
+                add_h = state.mouse_pos[1] - current
 
-            state.angle = rotation  # Rotate the UI handle.
-            state.db = db_average
-            self.arduino.send(rotation)  # Rotate the IRL handle.
+                if self.h_end + add_h > self.height:
+                    add_h = self.height - self.h_end
 
-            # When the music finishes reset the analysis.
-            if not pygame.mixer.music.get_busy():
-                pygame.mixer.music.stop()
+                if self.h_end + add_h - 70 >= self.h_start:
+                    self.h_end += add_h
+                    self.update_min_max()
 
-                # Reset variables.
-                self.audio_file.started = False
-                self.audio_file.paused = False
-                self.audio_file.loading = False
+        # Check if mouse is clicked in self.surface.
+        if not state.holding_mouse:
+            self.clicked = False
 
-                log.info("Resetting analysis")
+        if self.rect.collidepoint(state.mouse_pos):
+            if state.holding_mouse and not self.clicked:
+                self.toggle_playback()
+                self.clicked = True
+
+        if self.audio_file.cached:
+            self.update_min_max(reverse=True)
+            self.audio_file.cached = False
+
+    def toggle_playback(self) -> None:
+        """Starts, pauses or resumes the audio file, once it can be played."""
+        if self.audio_file.loading or self.audio_file.cancelled:
+            return
+
+        if self.audio_file.started:
+            self.audio_file.paused = not self.audio_file.paused
+
+            if self.audio_file.paused:
+                # Pause the audio file.
+                log.info("Pausing audio file")
+                pygame.mixer.music.pause()
+            else:
+                # Pause the audio file.
+                log.info("Resuming audio file")
+                pygame.mixer.music.unpause()
+        else:
+            # Play the audio file.
+            log.info("Playing audio file")
+            pygame.mixer.music.play(0)
+            self.audio_file.started = True
+
+    def update(self, dela_time: float) -> None:
+        """Updates the visualizer with the given data."""
+        self.handle_input()
+
+        if self.live:
+            self.bars.update(dela_time, self.controller.update_live(self.live))
+            return
+
+        # Update all the bars with the available dBs at the current position.
+        position = self.controller.update(self.audio_file)
+        self.bars.update(dela_time, self.audio_file.get_frame(position))
+
+    def get_dirty(self) -> List[pygame.Rect]:
+        """Gets the regions of the visualizer whose content changed since the last frame."""
+        bars = self.bars.heights.astype(np.int16).tobytes() if self.audio_file.file_path or self.live else None
+        db_height = int(state.db * self.bars.decibel_height_ratio + self.bars.max_height)
+
+        return [
+            *self.regions[0].check((
+                bars, self.audio_file.file_path, self.audio_file.loading, self.audio_file.started,
+                self.audio_file.paused, self.live is not None
+            )),
+            *self.regions[1].check((self.h_start, self.h_end, db_height))
+        ]
+
+    def toggle_live(self, source: Optional[Source] = None) -> None:
+        """Starts or stops following the live input, a microphone unless another source is given."""
+        if self.live:
+            self.live.stop()
+            log.info(f"Stopped live input, block latency {self.live.get_latency()}")
+            self.live = None
+            return
+
+        try:
+            live = LiveAnalyzer(source or MicrophoneSource())
+            live.start()
+        except (ImportError, OSError) as e:
+            log.error(f"Could not open the live input: {e!r}")
+            return
+
+        self.stop()
+        self.live = live
+        log.info("Started live input")
 
     def stop(self) -> None:
         """Stops the visualizer."""
         pygame.mixer.music.stop()
+        self.audio_file.cancel()
         self.audio_file = AudioFile("")
 
         # Reset cache dir to default.
@@ -171,13 +291,12 @@ class AudioVisualizer:
 
             if not (y / (m * 2)) % 2:
                 # Draw db level next to the line.
-                db = int(y / self.bars[0].decibel_height_ratio)
+                db = int(y / self.bars.decibel_height_ratio)
 
                 # Convert db to multiple of -10.
                 db = int(db / 10) * 10
 
-                font = Font(constants.visualizer.font, font_size)
-                text = font.render(str(db), True, constants.visualizer.font_color)
+                text = text_cache.render(str(db), constants.visualizer.font, font_size, constants.visualizer.font_color)
 
                 surface.blit(
                     text, (w + constants.visualizer.slider_text_offset, (y - offset - text.get_height() // 2)
@@ -185,7 +304,25 @@ class AudioVisualizer:
 
     def render(self, surface: Surface) -> None:
         """Renders the visualizer to the given surface."""
-        # Render the visualizer surface.
+        # Fill a black rectangle of the size of the visualizer.
+        self.surface.fill(constants.visualizer.background_color)
+
+        if not self.audio_file.file_path and not self.live:
+            # Render the drop image, highlighted while the mouse is over the visualizer.
+            if self.rect.collidepoint(state.mouse_pos):
+                self.image.set_alpha(255)
+            else:
+                self.image.set_alpha(constants.visualizer.drop_alpha)
+
+            self.surface.blit(self.image, (
+                self.width // 2 - self.image.get_width() // 2,
+                self.height // 2 - self.image.get_height() // 2))
+        else:
+            # Render the bars if a file is loaded.
+            self.bars.render(self.surface)
+
+        # Render the visualizer surface, dimmed while paused.
+        self.surface.set_alpha(220 if self.audio_file.paused else 255)
         surface.blit(self.surface, self.pos)
 
         # Draw the cable.
@@ -196,10 +333,6 @@ class AudioVisualizer:
             ))
         )
 
-        # Fill a black rectangle of the size of the visualizer.
-        pygame.draw.rect(self.surface, constants.visualizer.background_color, (0, 0, self.width, self.height))
-        self.surface.fill(constants.visualizer.background_color)
-
         # Draw a border around the visualizer.
         pygame.draw.rect(
             surface, constants.visualizer.border_color,
@@ -207,45 +340,29 @@ class AudioVisualizer:
             8, 20
         )
 
-        if not self.audio_file.file_path:
-            # Check if mouse is hovering over the visualizer.
-            if self.rect.collidepoint(state.mouse_pos):
-                if state.holding_mouse:
-                    # Prompt the user to select a file.
-                    filename = str(prompt_file())
-                    self.load_file(filename)
-
-                self.image.set_alpha(255)
-            else:
-                # Render the drop image.
-                self.image.set_alpha(constants.visualizer.drop_alpha)
-
-            self.surface.blit(self.image, (
-                self.width // 2 - self.image.get_width() // 2,
-                self.height // 2 - self.image.get_height() // 2))
-        else:
-            # Render the bars if a file is loaded.
-            for b in self.bars:
-                b.render(self.surface)
-
-            if not self.audio_file.loading and not self.audio_file.started:
-                font = Font(constants.visualizer.font, constants.visualizer.font_size)
-                text = font.render("Press Enter to start", True, constants.visualizer.font_color)
+        playable = not self.audio_file.loading and not self.audio_file.cancelled
+        if (self.audio_file.file_path or self.live) and playable and not self.audio_file.started:
+            text = text_cache.render(
+                "Press Enter to start", constants.visualizer.font, constants.visualizer.font_size,
+                constants.visualizer.font_color
+            )
 
-                rect = text.get_rect()
-                rect.center = ((self.width + self.pos[0] * 2) // 2, (self.height + self.pos[1] * 2) // 2)
+            rect = text.get_rect()
+            rect.center = ((self.width + self.pos[0] * 2) // 2, (self.height + self.pos[1] * 2) // 2)
 
-                # Render the text.
-                pygame.draw.rect(
-                    surface, constants.visualizer.font_color_light,
-                    (rect.x - 20, rect.y - 20, rect.width + 40, rect.height + 40),
-                    border_radius=13
-                )
-                surface.blit(text, rect)
+            # Render the text.
+            pygame.draw.rect(
+                surface, constants.visualizer.font_color_light,
+                (rect.x - 20, rect.y - 20, rect.width + 40, rect.height + 40),
+                border_radius=13
+            )
+            surface.blit(text, rect)
 
         if self.audio_file.paused:
-            font = Font(constants.visualizer.font, constants.visualizer.font_size)
-            text = font.render("Press Enter to resume", True, constants.visualizer.font_color)
+            text = text_cache.render(
+                "Press Enter to resume", constants.visualizer.font, constants.visualizer.font_size,
+                constants.visualizer.font_color
+            )
 
             rect = text.get_rect()
             rect.center = ((self.width + self.pos[0] * 2) // 2, (self.height + self.pos[1] * 2) // 2)
@@ -256,10 +373,7 @@ class AudioVisualizer:
                 (rect.x - 20, rect.y - 20, rect.width + 40, rect.height + 40),
                 border_radius=13
             )
-            self.surface.set_alpha(220)
             surface.blit(text, rect)
-        else:
-            self.surface.set_alpha(255)
 
         self.slider_surface = Surface((75 - 16, self.height))
         self.slider_surface.set_colorkey((0, 0, 0))
@@ -272,7 +386,7 @@ class AudioVisualizer:
         )
 
         # Draw the average db value.
-        desired_height = state.db * self.bars[0].decibel_height_ratio + self.bars[0].max_height
+        desired_height = state.db * self.bars.decibel_height_ratio + self.bars.max_height
         pygame.draw.rect(
             self.slider_surface, constants.visualizer.bar_color, (
                 0, self.h_start + max((self.height - desired_height) - self.h_start, 0),
@@ -296,98 +410,19 @@ class AudioVisualizer:
             ), 8, 20
         )
 
-        # Get top border and bottom border rect.
-        top_border_rect = pygame.Rect(0, 0, slider_rect.width, 64)
-        top_border_rect.center = (
-            (self.pos[0] - slider_rect.width - 25 - 8) + (slider_rect.width // 2),
-            self.pos[1] + self.h_start
-        )
-
-        bottom_border_rect = pygame.Rect(0, 0, slider_rect.width, 64)
-        bottom_border_rect.center = (
-            (self.pos[0] - slider_rect.width - 25 - 8) + (slider_rect.width // 2),
-            self.pos[1] + self.h_end
-        )
-
-        # Check if mouse is in top border.
-        if top_border_rect.collidepoint(state.mouse_pos):
-            if state.holding_mouse:
-                current = self.pos[1] - 8 + self.h_start
-                add_h = state.mouse_pos[1] - current
-
-                if self.h_start + add_h < 0:
-                    add_h = 0 - self.h_start
-
-                if self.h_start + add_h + 70 <= self.h_end:
-                    self.h_start += add_h
-                    self.update_min_max()
-
-        elif bottom_border_rect.collidepoint(state.mouse_pos):
-            if state.holding_mouse:
-                current = self.pos[1] - 8 + self.h_end
-                add_h = state.mouse_pos[1] - current
-
-                if self.h_end + add_h > self.height:
-                    add_h = self.height - self.h_end
-
-                if self.h_end + add_h - 70 >= self.h_start:
-                    self.h_end += add_h
-                    self.update_min_max()
-
-        # Check if mouse is clicked in self.surface.
-        if not state.holding_mouse:
-            self.clicked = False
-
-        if self.rect.collidepoint(state.mouse_pos):
-            if state.holding_mouse and not self.clicked:
-                if not self.audio_file.loading:
-                    if self.audio_file.started:
-                        self.audio_file.paused = not self.audio_file.paused
-
-                        if self.audio_file.paused:
-                            # Pause the audio file.
-                            log.info("Pausing audio file")
-                            pygame.mixer.music.pause()
-                        else:
-                            # Pause the audio file.
-                            log.info("Resuming audio file")
-                            pygame.mixer.music.unpause()
-                    else:
-                        # Play the audio file.
-                        log.info("Playing audio file")
-                        pygame.mixer.music.play(0)
-                        self.audio_file.started = True
-
-                self.clicked = True
-
-        if self.audio_file.cached:
-            self.update_min_max(reverse=True)
-            self.audio_file.cached = False
-
     def load_file(self, file_path: str) -> None:
         """Loads the given audio file."""
         # Check if the file is a valid audio file.
-        if not file_path.rsplit(".", 1)[1] in constants.audio.supported_formats:
+        if os.path.splitext(file_path)[1][1:] not in constants.audio.supported_formats:
             return
 
-        # Load the audio file.
+        # Load the audio file, cancelling the analysis of the previous one.
+        if self.live:
+            self.toggle_live()
+
+        self.audio_file.cancel()
         self.audio_file = AudioFile(file_path)
         pool.submit(self.audio_file.load)  # Load the audio file in a thread.
-        pool.submit(self.loading_animation)  # Start the loading animation.
-
-    def loading_animation(self) -> None:
-        """Renders the loading animation."""
-        # Define the loading animation.
-        animation = constants.visualizer.loading_animation
-        state.loading = True
-
-        while self.audio_file.loading:
-            # Set next animation frame.
-            state.loading_frame = next(animation)
-            time.sleep(constants.visualizer.loading_animation_speed)
-
-        # Stop the loading animation.
-        state.loading = False
 
 
 class AudioFile:
@@ -400,92 +435,134 @@ class AudioFile:
         self.paused = False
         self.loading = True
         self.cached = False
+        self.cancelled = False
+        self.failed = False
 
-        # Analytics settings.
-        self.frequencies_index_ratio = 1
+        # Analytics settings, the spectrogram is stored as (frames, bands) in dBFS.
+        self.frequencies = analysis.bar_frequencies()
+        self.frequencies_index_ratio = 1 / constants.visualizer.frequency_step
         self.time_index_ratio = 1
-        self.spectrogram = []
+        self.spectrogram = np.empty((0, len(self.frequencies)), dtype=np.int8)
 
-    def get_decibel(self, target_time: float, freq: float) -> int:
-        """Gets the decibel of the given frequency at the given time."""
-        try:
-            return self.spectrogram[int(freq * self.frequencies_index_ratio)][int(target_time * self.time_index_ratio)]
-        except IndexError:
-            return constants.visualizer.default_db
+        # The frame returned when nothing is analysed.
+        self.silence = np.full(len(self.frequencies), constants.visualizer.default_db, dtype=np.int8)
+        self.key = ""
+        self.cache_dir = ""
+
+        # Number of spectrogram frames ready to be read, grows while streaming.
+        self.analysed_frames = 0
+        self.timeline = Timeline()
+        self.job: Optional[AnalysisJob] = None
+
+    def get_index(self, target_time: float) -> int:
+        """Gets the spectrogram frame at the given time."""
+        return int(target_time * self.time_index_ratio)
+
+    def get_frame(self, target_time: float) -> np.ndarray:
+        """Gets the decibels of all the bars at the given time."""
+        frame = self.get_index(target_time)
+        if not 0 <= frame < self.analysed_frames:
+            return self.silence
+
+        return self.spectrogram[frame]
 
     def load(self) -> None:
         """Loads the audio file."""
         # Set the loading flag.
         self.loading = True
 
-        with open(self.file_path, "rb") as f:
-            file_hash = hashlib.md5()
-            while chunk := f.read(8192):
-                file_hash.update(chunk)
-
         # Save current profile.
         state.save()
 
-        file_hash = file_hash.hexdigest()
-        state.cache_dir = f"{settings.cache_path}/{file_hash}"
-
-        try:
-            with gzip.open(f"{state.cache_dir}/spectrogram.xz", "rb") as f:
-                self.spectrogram = pickle.load(f)
+        self.key = cache_manager.get_key(self.file_path)
+        if self.cancelled:
+            return
 
-            with open(f"{state.cache_dir}/ratios.json", "r") as f:
-                ratios = json.load(f)
+        state.cache_dir = self.cache_dir = f"{settings.cache_path}/{self.key}"
 
-                self.time_index_ratio = ratios["time_index_ratio"]
-                self.frequencies_index_ratio = ratios["frequencies_index_ratio"]
+        try:
+            self.spectrogram, ratios = load_spectrogram(self.cache_dir)
+            self.time_index_ratio = ratios["time_index_ratio"]
+            self.frequencies_index_ratio = ratios["frequencies_index_ratio"]
 
             # Load the file profile.
             state.load()
+            self.analysed_frames = len(self.spectrogram)
+            self.timeline.update(self.spectrogram, self.analysed_frames)
             self.cached = True
 
-        except (FileNotFoundError, TypeError, EOFError):
-            log.warning("No cache found for this file, generating...")
-            time_series, sample_rate = librosa.load(self.file_path)
-            stft = np.abs(librosa.stft(time_series, hop_length=512, n_fft=2048 * 4))
+            cache_manager.touch(self.key)
 
-            # Spectrogram and frequencies.
-            self.spectrogram = librosa.amplitude_to_db(stft, ref=np.max)
-            frequencies = librosa.core.fft_frequencies(n_fft=2048 * 4)
+            if self.cancelled:
+                return
 
-            # Ratios.
-            times = librosa.core.frames_to_time(np.arange(self.spectrogram.shape[1]), sr=sample_rate, hop_length=512,
-                                                n_fft=2048 * 4)
-            self.time_index_ratio = len(times) / times[len(times) - 1]
-            self.frequencies_index_ratio = len(frequencies) / frequencies[len(frequencies) - 1]
-
-            pool.submit(self.cache)
+        except (FileNotFoundError, ValueError, EOFError) as e:
+            log.warning(f"No usable cache found for this file ({e}), generating...")
+            self.analyse()
+            return
 
         pygame.mixer.music.load(self.file_path)
 
         # End the loading flag.
         self.loading = False
 
-    def cache(self) -> None:
-        """Saves the audio file."""
-        if not os.path.exists(state.cache_dir):
-            os.makedirs(state.cache_dir)
+    def analyse(self) -> None:
+        """Analyses the audio file in a worker process, playback may start once the lead buffer is ready."""
+        self.job = AnalysisJob(self.file_path, self.cache_dir)
+        self.job.start()
 
-        with gzip.open(f"{state.cache_dir}/spectrogram.xz", "wb") as f:
-            pickle.dump(self.spectrogram, f)
+        while not self.cancelled and not self.job.done:
+            self.job.poll()
+            if self.job.error:
+                log.error(f"Failed to analyse {self.file_path}: {self.job.error}")
+                self.cancel()
+                self.failed = True
+                return
 
-        with open(f"{state.cache_dir}/ratios.json", "w") as f:
-            json.dump({
-                "time_index_ratio": self.time_index_ratio,
-                "frequencies_index_ratio": self.frequencies_index_ratio
-            }, f)
+            if self.job.spectrogram is None or self.cancelled:
+                continue
 
-        # Move the file to the cache directory.
-        recent_dir = f"{settings.cache_path}/recent"
-        if not os.path.exists(recent_dir):
-            os.makedirs(recent_dir)
+            if self.spectrogram is not self.job.spectrogram:
+                self.spectrogram = self.job.spectrogram
+                self.time_index_ratio = self.job.ratios["time_index_ratio"]
 
-        try:
-            shutil.copy(self.file_path, f"{settings.cache_path}/recent/{os.path.basename(self.file_path)}")
-            log.info(f"Moved {self.file_path} to recent directory")
-        except shutil.SameFileError:
-            log.warning(f"{self.file_path} is already in recent directory")
+            self.analysed_frames = self.job.analysed_frames
+            # Without streaming, playback waits for the whole spectrogram.
+            lead = len(self.spectrogram)
+            if constants.analysis.streaming:
+                lead = min(int(constants.analysis.lead_time * self.time_index_ratio), lead)
+
+            if self.loading and (self.analysed_frames >= lead or self.job.done):
+                pygame.mixer.music.load(self.file_path)
+                self.loading = False
+
+        if self.cancelled:
+            # The shared memory may have been created after the job was cancelled.
+            self.job.close()
+            return
+
+        # The worker cached the spectrogram, read it from there and release the shared memory.
+        self.spectrogram, _ = load_spectrogram(self.cache_dir)
+        self.analysed_frames = len(self.spectrogram)
+        self.job.close()
+
+        if self.loading:
+            pygame.mixer.music.load(self.file_path)
+            self.loading = False
+
+        pool.submit(self.cache)
+
+    def cancel(self) -> None:
+        """Cancels the analysis in flight, if any."""
+        self.cancelled = True
+        self.loading = False
+
+        if self.job:
+            self.spectrogram = np.empty((0, len(self.frequencies)), dtype=np.int8)
+            self.analysed_frames = 0
+            self.job.cancel()
+
+    def cache(self) -> None:
+        """Records the cache written by the worker."""
+        # Link the file into the recent directory and keep the cache within its budget.
+        cache_manager.add(self.key, self.file_path, protected={os.path.basename(state.cache_dir)})
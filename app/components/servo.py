@@ -1,13 +1,13 @@
 import math
-from typing import Tuple
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 import pygame
 from pygame import Rect, Surface
-from pygame.font import Font
 
 from app.core import constants
 from app.state import state
-from app.utils.ui import draw_pie, draw_triangle
+from app.utils.ui import DirtyRegion, draw_pie, draw_triangle, text_cache
 
 
 class Handle:
@@ -23,8 +23,18 @@ class Handle:
         self.origin = (constants.handle.origin_start, self.image.get_height() // 2)
 
         # Geometry properties.
+        self.angle = 0
         self.rotated_image, self.rect = self.image, self.image.get_rect()
 
+        # Rotated images and their rects by angle, rotated on the first use.
+        self.rotations: Dict[int, Tuple[Surface, Rect]] = {}
+
+        # The overlays are shown while the mouse is around the handle.
+        self.hitbox = Rect(
+            self.pos[0] - self.width // 2, self.pos[1] - constants.handle.hitbox[1] // 2,
+            constants.handle.hitbox[0] * 2, constants.handle.hitbox[1]
+        )
+
         # Point properties.
         self.last_angle_clicked = False
         self.last_point_angle = 0
@@ -35,8 +45,23 @@ class Handle:
         self.last_range_surface: str = ""
         self.new_angle = False
 
+        # What the mouse is over, the highlighted range selector and the hovered point.
+        self.highlighted: str = ""
+        self.hovered: Optional[Tuple[int, Tuple[float, float], bool]] = None
+
+        # Overlay surfaces by rotation range, the least recently used are dropped first.
+        self.overlays: OrderedDict = OrderedDict()
+
     def update(self, angle: int) -> None:
         """Rotates the handle around the pivot point by the given angle."""
+        self.angle = angle
+        if angle not in self.rotations:
+            self.rotations[angle] = self.rotate(angle)
+
+        self.rotated_image, self.rect = self.rotations[angle]
+
+    def rotate(self, angle: int) -> Tuple[Surface, Rect]:
+        """Gets the image rotated around the pivot point by the given angle, and where to draw it."""
         # Convert to arduino rotations.
         angle -= 90
 
@@ -47,81 +72,92 @@ class Handle:
         rotated_offset = offset_center_to_pivot.rotate(-angle)
         rotated_image_center = (self.pivot[0] - rotated_offset.x, self.pivot[1] - rotated_offset.y)
 
-        # Get a rotated image.
-        self.rotated_image = pygame.transform.rotate(self.image, angle)
-        self.rect = self.rotated_image.get_rect(center=rotated_image_center)
+        # Get a rotated image, in the display's pixel format when there is one.
+        rotated_image = pygame.transform.rotate(self.image, angle)
+        if pygame.display.get_surface():
+            rotated_image = rotated_image.convert_alpha()
 
-    def render(self, surface: Surface) -> None:
-        """Renders the handle on the given surface."""
-        surface.blit(self.rotated_image, self.rect)
+        return rotated_image, rotated_image.get_rect(center=rotated_image_center)
 
-        if pygame.mixer.music.get_busy():
-            # Create a center square of size 200x200 around the handle.
-            rect = Rect(
-                self.pos[0] - self.image.get_width() // 2, self.pos[1] - constants.handle.hitbox[1] // 2,
-                constants.handle.hitbox[0] * 2, constants.handle.hitbox[1]
-            )
+    def get_region(self) -> Rect:
+        """Gets the rectangle the handle, its overlays and the hovered angle are drawn in."""
+        radius = self.width + 2
+        reach = int(radius + radius / constants.handle.draw_width_multiplier + constants.handle.font_size * 2)
+
+        rect = Rect(0, 0, reach * 2, reach * 2)
+        rect.center = (int(self.pivot[0] - self.origin[0]), int(self.pivot[1]))
+        return rect.union(self.hitbox)
 
-            if not rect.collidepoint(state.mouse_pos):
-                return
+    def get_overlays(self, rotations_range: Tuple[int, int]) -> tuple:
+        """Gets the overlays with their positions, the range selectors and the range ends, drawn on the first use."""
+        if rotations_range in self.overlays:
+            self.overlays.move_to_end(rotations_range)
+            return self.overlays[rotations_range]
 
         # Geometry values.
         pivot = self.pivot[0] - self.origin[0], self.pivot[1]
         radius, draw_width = self.width + 2, (self.width + 2) / constants.handle.draw_width_multiplier
-
-        # Draw a pie from the pivot point using the rotation range.
-        surf = draw_pie(radius, constants.handle.pie_color, *state.rotations_range)
-        surface.blit(surf, (pivot[0] - radius, pivot[1] - radius))
-
-        # Draw the pie's border.
-        surf = draw_pie(
-            radius, constants.handle.pie_border_color,
-            *state.rotations_range, width=constants.handle.pie_border_width
-        )
-        surface.blit(surf, (pivot[0] - radius, pivot[1] - radius))
+        low, high = rotations_range
+
+        # Draw a pie from the pivot point using the rotation range, and its border.
+        surfaces = [
+            (draw_pie(radius, constants.handle.pie_color, low, high), (pivot[0] - radius, pivot[1] - radius)),
+            (
+                draw_pie(radius, constants.handle.pie_border_color, low, high, width=constants.handle.pie_border_width),
+                (pivot[0] - radius, pivot[1] - radius)
+            )
+        ]
 
         # Calculate the coordinates of the rotation range start and end
         pos_up: Tuple[int, int] = (
-            int(pivot[0] + math.cos(math.radians(state.rotations_range[1] - 90)) * radius),
-            int(pivot[1] - math.sin(math.radians(state.rotations_range[1] - 90)) * radius)
+            int(pivot[0] + math.cos(math.radians(high - 90)) * radius),
+            int(pivot[1] - math.sin(math.radians(high - 90)) * radius)
         )
 
         pos_down: Tuple[int, int] = (
-            int(pivot[0] + math.cos(math.radians(state.rotations_range[0] - 90)) * radius),
-            int(pivot[1] - math.sin(math.radians(state.rotations_range[0] - 90)) * radius)
+            int(pivot[0] + math.cos(math.radians(low - 90)) * radius),
+            int(pivot[1] - math.sin(math.radians(low - 90)) * radius)
         )
 
         # Draw triangles to fill the gap between the pie and the border.
-        surf = draw_triangle(constants.handle.triangle_color, pivot, (pivot[0], pivot[1] + self.origin[1]), pos_down)
-        surface.blit(surf, (0, 0))
-
-        surf = draw_triangle(constants.handle.triangle_color, pivot, (pivot[0], pivot[1] - self.origin[1]), pos_up)
-        surface.blit(surf, (0, 0))
+        surfaces.append(draw_triangle(
+            constants.handle.triangle_color, pivot, (pivot[0], pivot[1] + self.origin[1]), pos_down
+        ))
+        surfaces.append(draw_triangle(
+            constants.handle.triangle_color, pivot, (pivot[0], pivot[1] - self.origin[1]), pos_up
+        ))
 
         # Draw the rotation range selectors.
         range_surfaces = (
-            draw_pie(
-                draw_width, constants.handle.range_surfaces_color,
-                95 + state.rotations_range[0], 180 + state.rotations_range[0]
-            ),
-            draw_pie(
-                draw_width, constants.handle.range_surfaces_color,
-                0 - (180 - state.rotations_range[1]), 85 - (180 - state.rotations_range[1])
-            )
+            draw_pie(draw_width, constants.handle.range_surfaces_color, 95 + low, 180 + low),
+            draw_pie(draw_width, constants.handle.range_surfaces_color, 0 - (180 - high), 85 - (180 - high))
         )
 
-        # Draw the allowed angles onto the surface.
-        for angle in state.allowed_rotations:
-            if state.rotations_range[0] <= angle <= state.rotations_range[1]:
-                # Calculate the coordinates of the angles on the circle.
-                pos = (
-                    pivot[0] + math.cos(math.radians(angle - 90)) * radius,
-                    pivot[1] - math.sin(math.radians(angle - 90)) * radius
-                )
-                pygame.draw.circle(surface, constants.handle.point_color, pos, 3)
+        overlays = (surfaces, range_surfaces, pos_down, pos_up)
+        self.overlays[rotations_range] = overlays
+        if len(self.overlays) > constants.handle.overlay_cache_size:
+            self.overlays.popitem(last=False)
+
+        return overlays
+
+    def get_visible(self) -> bool:
+        """Whether the overlays are shown, always while paused and around the handle while playing."""
+        return not pygame.mixer.music.get_busy() or self.hitbox.collidepoint(state.mouse_pos)
+
+    def handle_input(self) -> None:
+        """Handles the mouse every frame, whether or not the handle is redrawn."""
+        self.hovered = None
+        if not self.get_visible():
+            return
+
+        # Geometry values.
+        pivot = self.pivot[0] - self.origin[0], self.pivot[1]
+        radius, draw_width = self.width + 2, (self.width + 2) / constants.handle.draw_width_multiplier
+        _, range_surfaces, pos_down, pos_up = self.get_overlays(state.rotations_range)
 
         # Change the rotation ranges if the mouse is pressed.
         if state.holding_mouse:
+            self.highlighted = ""
             if self.last_range_surface == "up":
                 # Get angle from mouse position to pivot point.
                 angle = math.degrees(math.atan2(state.mouse_pos[1] - pivot[1], state.mouse_pos[0] - pivot[0])) + 90
@@ -130,12 +166,9 @@ class Handle:
                     if int(180 - angle) > 176:
                         state.rotations_range = (state.rotations_range[0], 180)
                     else:
-                        for allowed_angle in state.allowed_rotations:
-                            if abs(int(180 - angle) - allowed_angle) <= 5:
-                                state.rotations_range = (state.rotations_range[0], allowed_angle)
-                                break
-                        else:
-                            state.rotations_range = (state.rotations_range[0], int(180 - angle))
+                        # Snap to an allowed angle within 5 degrees.
+                        high = state.allowed_rotations.snap(int(180 - angle), 5)
+                        state.rotations_range = (state.rotations_range[0], high)
 
             elif self.last_range_surface == "down":
                 # Get angle from mouse position to pivot point.
@@ -145,100 +178,122 @@ class Handle:
                     if int(180 - angle) < 4:
                         state.rotations_range = (0, state.rotations_range[1])
                     else:
-                        for allowed_angle in state.allowed_rotations:
-                            if abs(int(180 - angle) - allowed_angle) <= 5:
-                                state.rotations_range = (allowed_angle, state.rotations_range[1])
-                                break
-                        else:
-                            state.rotations_range = (int(180 - angle), state.rotations_range[1])
+                        # Snap to an allowed angle within 5 degrees.
+                        low = state.allowed_rotations.snap(int(180 - angle), 5)
+                        state.rotations_range = (low, state.rotations_range[1])
 
             # Add or remove allowed rotation if mouse is clicked.
             elif self.last_point_rect.collidepoint(state.mouse_pos) and not self.last_angle_clicked:
                 self.last_angle_clicked = True  # Prevent adding the same angle twice.
                 self.new_angle = False  # Reset the new angle flag.
 
-                if self.last_point_angle in state.allowed_rotations:
-                    state.allowed_rotations.remove(self.last_point_angle)
-                else:
-                    state.allowed_rotations.append(self.last_point_angle)
+                state.allowed_rotations.toggle(self.last_point_angle)
+            return
+
+        # Check if the mouse is in the rotation range surfaces.
+        if range_surfaces[1].get_rect(
+                topleft=(pos_up[0] - draw_width, pos_up[1] - draw_width)
+        ).collidepoint(state.mouse_pos):
+            self.last_range_surface = self.highlighted = "up"
+
+        elif range_surfaces[0].get_rect(
+                topleft=(pos_down[0] - draw_width, pos_down[1] - draw_width)
+        ).collidepoint(state.mouse_pos):
+            self.last_range_surface = self.highlighted = "down"
         else:
-            # Check if the mouse is in the rotation range surfaces.
-            if range_surfaces[1].get_rect(
-                    topleft=(pos_up[0] - draw_width, pos_up[1] - draw_width)
-            ).collidepoint(state.mouse_pos):
-                range_surfaces[1].set_alpha(constants.handle.range_alpha)
-                self.last_range_surface = "up"
-
-            elif range_surfaces[0].get_rect(
-                    topleft=(pos_down[0] - draw_width, pos_down[1] - draw_width)
-            ).collidepoint(state.mouse_pos):
-                range_surfaces[0].set_alpha(constants.handle.range_alpha)
-                self.last_range_surface = "down"
+            # Show the closest point on the circle to the mouse.
+            self.last_range_surface = self.highlighted = ""
+            self.last_angle_clicked = False
+            # Get the closest point in circle to mouse position.
+            angle = -math.degrees(math.atan2(state.mouse_pos[1] - pivot[1], state.mouse_pos[0] - pivot[0])) + 90
+
+            # Make angle multiple of 5.
+            angle = int((angle // constants.handle.angle_multiple) * constants.handle.angle_multiple)
+            if state.rotations_range[0] <= angle <= state.rotations_range[1]:
+                # Calculate the coordinates of the point on the circle.
+                pos = (
+                    pivot[0] + math.cos(math.radians(angle - 90)) * radius,
+                    pivot[1] - math.sin(math.radians(angle - 90)) * radius
+                )
+
+                rect = Rect(
+                    pos[0] - constants.handle.point_hitbox / 2, pos[1] - constants.handle.point_hitbox / 2,
+                    constants.handle.point_hitbox, constants.handle.point_hitbox)
+                if rect.collidepoint(state.mouse_pos):
+                    if angle != self.last_point_angle:
+                        self.new_angle = True
+
+                    # The point is drawn red when clicking it would remove it.
+                    self.hovered = (angle, pos, angle in state.allowed_rotations and self.new_angle)
+                else:
+                    self.new_angle = False
+
+                self.last_point_rect = rect
+                self.last_point_angle = angle
+
+    def render(self, surface: Surface) -> None:
+        """Renders the handle on the given surface."""
+        surface.blit(self.rotated_image, self.rect)
+
+        if not self.get_visible():
+            return
+
+        # Geometry values.
+        pivot = self.pivot[0] - self.origin[0], self.pivot[1]
+        radius, draw_width = self.width + 2, (self.width + 2) / constants.handle.draw_width_multiplier
+
+        # The overlays only change with the rotation range, so they are drawn once per range.
+        overlays, range_surfaces, pos_down, pos_up = self.get_overlays(state.rotations_range)
+        for surf, pos in overlays:
+            surface.blit(surf, pos)
+
+        # Draw the allowed angles onto the surface.
+        for angle in state.allowed_rotations:
+            if state.rotations_range[0] <= angle <= state.rotations_range[1]:
+                # Calculate the coordinates of the angles on the circle.
+                pos = (
+                    pivot[0] + math.cos(math.radians(angle - 90)) * radius,
+                    pivot[1] - math.sin(math.radians(angle - 90)) * radius
+                )
+                pygame.draw.circle(surface, constants.handle.point_color, pos, 3)
+
+        # Draw the point under the mouse and its angle.
+        if self.hovered:
+            angle, pos, deleting = self.hovered
+            surf = Surface((constants.handle.point_radius * 2, constants.handle.point_radius * 2))
+            surf.set_colorkey((255, 255, 255))
+
+            if deleting:
+                surf.set_colorkey((0, 0, 0))
+                pygame.draw.circle(
+                    surf, constants.handle.delete_point_color,
+                    (constants.handle.point_radius, constants.handle.point_radius),
+                    constants.handle.point_radius
+                )
             else:
-                # Show the closest point on the circle to the mouse.
-                self.last_range_surface = ""
-                self.last_angle_clicked = False
-                # Get the closest point in circle to mouse position.
-                angle = -math.degrees(math.atan2(state.mouse_pos[1] - pivot[1], state.mouse_pos[0] - pivot[0])) + 90
-
-                # Make angle multiple of 5.
-                angle = int((angle // constants.handle.angle_multiple) * constants.handle.angle_multiple)
-                if state.rotations_range[0] <= angle <= state.rotations_range[1]:
-                    # Calculate the coordinates of the point on the circle.
-                    pos = (
-                        pivot[0] + math.cos(math.radians(angle - 90)) * radius,
-                        pivot[1] - math.sin(math.radians(angle - 90)) * radius
-                    )
-
-                    # Draw circle at pos.
-                    rect = Rect(
-                        pos[0] - constants.handle.point_hitbox / 2, pos[1] - constants.handle.point_hitbox / 2,
-                        constants.handle.point_hitbox, constants.handle.point_hitbox)
-                    if rect.collidepoint(state.mouse_pos):
-                        surf = Surface((constants.handle.point_radius * 2, constants.handle.point_radius * 2))
-                        surf.set_colorkey((255, 255, 255))
-
-                        if angle != self.last_point_angle:
-                            self.new_angle = True
-
-                        if angle in state.allowed_rotations and self.new_angle:
-                            surf.set_colorkey((0, 0, 0))
-                            pygame.draw.circle(
-                                surf, constants.handle.delete_point_color,
-                                (constants.handle.point_radius, constants.handle.point_radius),
-                                constants.handle.point_radius
-                            )
-                        else:
-                            pygame.draw.circle(
-                                surf, (255, 255, 255),
-                                (constants.handle.point_radius, constants.handle.point_radius),
-                                constants.handle.point_radius
-                            )
-
-                        surface.blit(
-                            surf, (pos[0] - constants.handle.point_radius, pos[1] - constants.handle.point_radius)
-                        )
-
-                        # Render angle text.
-                        font = Font(constants.handle.font, constants.handle.font_size)
-                        text = font.render(str(angle), True, constants.handle.font_color)
-                        text_rect = text.get_rect()
-                        text_rect.center = (pos[0], pos[1] + constants.handle.font_size)
-                        surface.blit(text, text_rect)
-
-                        self.last_point_angle = angle
-                        self.last_point_rect = rect
+                pygame.draw.circle(
+                    surf, (255, 255, 255),
+                    (constants.handle.point_radius, constants.handle.point_radius),
+                    constants.handle.point_radius
+                )
 
-                    else:
-                        self.new_angle = False
+            surface.blit(surf, (pos[0] - constants.handle.point_radius, pos[1] - constants.handle.point_radius))
 
-                    self.last_point_rect = Rect(
-                        pos[0] - constants.handle.point_hitbox / 2, pos[1] - constants.handle.point_hitbox / 2,
-                        constants.handle.point_hitbox, constants.handle.point_hitbox
-                    )
-                    self.last_point_angle = angle
+            # Render angle text.
+            text = text_cache.render(
+                str(angle), constants.handle.font, constants.handle.font_size, constants.handle.font_color
+            )
+            text_rect = text.get_rect()
+            text_rect.center = (pos[0], pos[1] + constants.handle.font_size)
+            surface.blit(text, text_rect)
+
+        # Draw the rotation range surfaces, the one under the mouse highlighted. They are cached, so the alpha is
+        # set every frame.
+        for surf, name in zip(range_surfaces, ("down", "up")):
+            surf.set_alpha(
+                constants.handle.range_alpha if self.highlighted == name else constants.handle.range_surfaces_color[3]
+            )
 
-        # Draw the rotation range surfaces.
         surface.blit(range_surfaces[0], (pos_down[0] - draw_width, pos_down[1] - draw_width))
         surface.blit(range_surfaces[1], (pos_up[0] - draw_width, pos_up[1] - draw_width))
 
@@ -258,9 +313,19 @@ class Servo:
             self.pos[1] + self.image.get_height() // 2
         ))
 
+        self.region = DirtyRegion(self.image.get_rect(topleft=self.pos).union(self.handle.get_region()))
+
     def update(self, angle: int) -> None:
-        """Updates the handle's angle."""
+        """Updates the handle's angle and handles the mouse."""
         self.handle.update(angle)
+        self.handle.handle_input()
+
+    def get_dirty(self) -> List[Rect]:
+        """Gets the region of the servo if the handle or its overlays changed since the last frame."""
+        return self.region.check((
+            self.handle.angle, state.rotations_range, id(state.allowed_rotations), state.allowed_rotations.version,
+            pygame.mixer.music.get_busy()
+        ))
 
     def render(self, screen: Surface) -> None:
         """Renders the handle to the given surface."""
@@ -0,0 +1,79 @@
+import logging
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pygame
+
+from app.live import LiveAnalyzer
+from app.state import state
+from app.utils.arduino import rotation_table
+from app.utils.clock import Jitter, PlaybackClock, get_lookahead
+
+if TYPE_CHECKING:
+    from app.components.arduino import Arduino
+    from app.components.audio import AudioFile
+
+log = logging.getLogger(__name__)
+
+
+class Controller:
+    """Drives the servos from the playing audio, with or without a window."""
+
+    def __init__(self, arduino: "Arduino"):
+        self.arduino = arduino
+
+        # The angle is sent ahead of the playback position by the delay of the audio, serial link and servo.
+        self.clock = PlaybackClock()
+        self.jitter = Jitter()
+        self.frequency = pygame.mixer.get_init()[0]
+
+    def update(self, audio_file: "AudioFile") -> float:
+        """Sends the angles of the audio file at the playback position, and returns the position."""
+        if not audio_file.started or audio_file.paused:
+            self.clock.reset()
+            self.jitter.reset()
+            return pygame.mixer.music.get_pos() / 1000.0
+
+        position = self.clock.update(pygame.mixer.music.get_pos() / 1000.0)
+
+        # Look the rotation up in the timeline, it is only recomputed for new frames or profile changes.
+        audio_file.timeline.update(audio_file.spectrogram, audio_file.analysed_frames)
+        lookahead = get_lookahead(self.frequency, self.arduino.get_latency())
+        frame = audio_file.get_index(position + lookahead)
+        db_average, rotation = audio_file.timeline.get(frame)
+
+        state.angle = rotation  # Rotate the UI handle.
+        state.db = db_average
+        self.arduino.send(audio_file.timeline.get_angles(frame))  # Rotate the IRL handles.
+        self.jitter.record()
+
+        # When the music finishes reset the analysis.
+        if not pygame.mixer.music.get_busy():
+            pygame.mixer.music.stop()
+
+            # Reset variables.
+            audio_file.started = False
+            audio_file.paused = False
+            audio_file.loading = False
+
+            stats = self.jitter.get_stats()
+            log.info(
+                f"Servo angle sent every {stats['mean']:.1f}ms, jitter {stats['std']:.1f}ms "
+                f"(max {stats['max']:.1f}ms)"
+            )
+            log.info("Resetting analysis")
+
+        return position
+
+    def update_live(self, live: LiveAnalyzer) -> np.ndarray:
+        """Sends the angles of the latest frame of the live input, and returns the frame."""
+        frame = live.poll()
+        envelope = rotation_table.get_envelope(frame[np.newaxis])[0]
+        rotations = rotation_table.lookup(envelope)
+
+        state.angle = int(rotations[0])  # Rotate the UI handle.
+        state.db = float(envelope[0])
+        self.arduino.send(rotations)  # Rotate the IRL handles.
+        self.jitter.record()
+
+        return frame
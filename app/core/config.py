@@ -8,5 +8,8 @@ class Global:
     cache_path: str = user_cache_dir("AnimatronicControl")
     resources_path: str = "data"
 
+    # Bytes the analysis cache and its recent files may use before the least recently used are evicted.
+    cache_size_limit: int = 2 * 1024 ** 3
+
 
 settings = Global()
@@ -1,13 +1,30 @@
-from itertools import cycle
 from pathlib import Path
 
 from app.core.config import settings
 
 
+class Analysis:
+    """The audio analysis settings."""
+
+    n_fft = 2048 * 4
+    hop_length = 512
+
+    # Ingestion, files are decoded in blocks and resampled to `sample_rate` (None keeps the native rate).
+    # A `res_type` of None picks soxr when it is installed, and scipy's polyphase filter otherwise.
+    sample_rate = 22050
+    res_type = None
+    decode_block_size = 65536
+
+    # Streaming analysis, playback starts once `lead_time` seconds are analysed.
+    streaming = True
+    block_frames = 256
+    lead_time = 2
+
+
 class Animations:
     """The animations used in the app."""
 
-    loading = cycle(sorted(Path(f"{settings.resources_path}/images/loading").glob('*.gif'), key=lambda x: x.stem))
+    loading = tuple(sorted(Path(f"{settings.resources_path}/images/loading").glob('*.gif'), key=lambda x: x.stem))
 
 
 class Arduino:
@@ -15,14 +32,47 @@ class Arduino:
 
     pos = (400, 25)
 
+    # USB vendors of arduino boards and of the USB serial chips of their clones.
+    vendor_ids = (0x2341, 0x2A03, 0x1A86, 0x0403, 0x10C4)
+
+    # Boards announce themselves once the bootloader ran, which is waited for instead of a fixed delay.
+    ready_timeout = 2.5
+    ready_poll = 0.05
+
+    # Seconds between connection attempts, doubled after every failure and reset when a port is plugged in.
+    backoff = (0.25, 8)
+    hotplug_interval = 0.25
+
+    # Boards start at `baud_rate` and are asked to switch to `fast_baud_rate`, one of the rates they support.
+    baud_rate = 9600
+    baud_rates = (9600, 19200, 38400, 57600, 115200, 250000)
+    fast_baud_rate = 115200
+    handshake_timeout = 0.5
+
+    # Angles are written at most `control_rate` times a second, an unchanged angle only after `resend_interval`.
+    control_rate = 50
+    resend_interval = 0.5
+
+    # The board echoes a ping this often to measure the round trip, None disables it.
+    ping_interval = 1.0
+
+    # Shows compiled for the board to play on its own, they must fit in the flash the sketch leaves free.
+    show_rate = 25
+    show_size_limit = 24 * 1024
+    eeprom_size = 1024
+
+    # Telemetry panel, toggled with T.
+    telemetry_font_size = 14
+    telemetry_color = (191, 200, 200)
+    telemetry_background = (27, 38, 43, 220)
+    telemetry_padding = 8
+
 
 class Audio:
     """The audio settings."""
 
     supported_formats = ["mp3", "wav", "ogg"]
 
-    baud_rate = 9600
-
 
 class Colors:
     """The colors used in the app."""
@@ -41,6 +91,8 @@ class Fonts:
 
     roboto_bold = Path(f"{settings.resources_path}/fonts/Roboto-Bold.ttf")
 
+    text_cache_size = 256  # Rendered texts kept for the next frames.
+
 
 class Handle:
     """The handle settings."""
@@ -65,6 +117,7 @@ class Handle:
     angle_multiple = 5
     range_gap = 30
     range_alpha = 100
+    overlay_cache_size = 16  # Rotation ranges whose overlays are kept drawn, about 400 kB each.
 
     font = Fonts.roboto_bold
     font_color = Colors.light_black
@@ -87,6 +140,35 @@ class Images:
     rob = Path(f"{settings.resources_path}/images/icon.ico")
 
 
+class Latency:
+    """The latency compensation settings."""
+
+    # Seconds the servo angle is sent ahead of the audio, computed from the settings below and the baud rate when None.
+    lookahead = None
+    mixer_buffer = 512
+    servo = 0.05
+
+    # Share of the playback clock error corrected every update, larger errors resynchronise it.
+    drift_gain = 0.05
+    resync_threshold = 0.1
+
+    # Send intervals kept for the jitter statistics.
+    jitter_window = 256
+
+
+class Live:
+    """The live input analysis settings."""
+
+    # Shorter frames than file analysis, a frame lags the input by about half of `n_fft`.
+    sample_rate = 22050
+    n_fft = 2048
+    hop_length = 512
+    block_size = 512
+
+    # Backlogged blocks beyond this are dropped so the output never lags further behind.
+    max_backlog = 8
+
+
 class Window:
     """The window settings."""
 
@@ -94,6 +176,10 @@ class Window:
     title = "Animatronic Control"
     fps = 60
 
+    # Above these the whole window is redrawn instead of the regions that changed.
+    dirty_rect_limit = 16
+    dirty_area_limit = 0.75  # Fraction of the window.
+
 
 class Visualizer:
     """The audio visualizer settings."""
@@ -102,7 +188,8 @@ class Visualizer:
     pos = (150, 50)
 
     # Analyzer settings.
-    frequency_range = (100, 8100)  # 100 frequencies jump.
+    frequency_range = (100, 8100)
+    frequency_step = 100
 
     # Colors.
     background_color = (67, 78, 83)
@@ -117,7 +204,7 @@ class Visualizer:
 
     # Animations.
     loading_animation = Animations.loading
-    loading_animation_speed = 0.03
+    loading_animation_speed = 0.03  # Seconds a frame is shown.
 
     # Fonts.
     font = Fonts.roboto_bold
@@ -134,6 +221,7 @@ class Visualizer:
 class Constants:
     """The app constants."""
 
+    analysis = Analysis()
     animations = Animations()
     arduino = Arduino()
     audio = Audio()
@@ -141,6 +229,8 @@ class Constants:
     fonts = Fonts()
     handle = Handle()
     images = Images()
+    latency = Latency()
+    live = Live()
     window = Window()
     visualizer = Visualizer()
 
@@ -0,0 +1,58 @@
+import logging
+import os
+import time
+
+import pygame
+
+from app.components.arduino import Arduino
+from app.components.audio import AudioFile
+from app.controller import Controller
+from app.core import constants
+from app.state import pool, state
+
+log = logging.getLogger(__name__)
+
+
+def play(file_path: str, rate: float = constants.arduino.control_rate) -> int:
+    """Plays an audio file and drives the servos without a window, returning the exit code."""
+    if not os.path.isfile(file_path):
+        log.error(f"No such file {file_path}")
+        return 1
+
+    # Only the mixer is initialised, there is no display.
+    pygame.mixer.init()
+
+    arduino = Arduino(constants.arduino.pos)
+    controller = Controller(arduino)
+    audio_file = AudioFile(file_path)
+
+    try:
+        # Playback starts once the file is cached, or once the lead of a streamed analysis is ready.
+        loading = pool.submit(audio_file.load)
+        while audio_file.loading and not loading.done():
+            time.sleep(0.01)
+
+        if audio_file.cancelled or (loading.done() and loading.exception()):
+            log.error(f"Could not load {file_path}: {loading.exception() if loading.done() else 'analysis failed'}")
+            return 1
+
+        log.info(f"Playing {file_path}")
+        pygame.mixer.music.play(0)
+        audio_file.started = True
+
+        # Run the control loop at its own rate, sleeping in between.
+        tick = time.monotonic()
+        while audio_file.started:
+            controller.update(audio_file)
+
+            tick = max(tick + 1 / rate, time.monotonic())
+            time.sleep(max(tick - time.monotonic(), 0))
+    except KeyboardInterrupt:
+        log.info("Stopped playing")
+    finally:
+        pygame.mixer.music.stop()
+        audio_file.cancel()
+        arduino.close()
+        state.save()
+
+    return 0
@@ -0,0 +1,289 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from serial import Serial, SerialException
+from serial.tools import list_ports
+
+from app.core import constants
+from app.utils import protocol
+
+log = logging.getLogger(__name__)
+
+
+class SerialLink:
+    """Owns a serial connection, writes the latest value of every channel and reads the board's replies."""
+
+    def __init__(
+            self, serial: Serial, control_rate: float = constants.arduino.control_rate,
+            resend_interval: float = constants.arduino.resend_interval,
+            ping_interval: Optional[float] = constants.arduino.ping_interval
+    ):
+        self.serial = serial
+        self.period = 1 / control_rate
+        self.resend_interval = resend_interval
+        self.ping_interval = ping_interval
+
+        # The mailbox holds one value per channel, a newer value replaces one that was not sent yet.
+        self.mailbox: Dict[int, int] = {}
+        self.condition = threading.Condition()
+
+        # Values the board has and when they were sent, unchanged values are only sent again now and then.
+        self.sent: Dict[int, int] = {}
+        self.sent_at: Dict[int, float] = {}
+
+        # Pings waiting for their echo, by sequence number.
+        self.pings: Dict[int, float] = {}
+        self.sequence = 0
+        self.parser = protocol.Parser()
+
+        # Statistics.
+        self.writes = 0
+        self.commands = 0
+        self.bytes = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self.board_errors = 0
+        self.latencies = np.zeros(constants.latency.jitter_window, dtype=np.float64)
+        self.round_trips = np.zeros(constants.latency.jitter_window, dtype=np.float64)
+        self.replies = 0
+
+        # Totals at the start of the current rate window, and the rates of the last one.
+        self.window = (time.monotonic(), 0, 0)
+        self.rates = (0.0, 0.0)
+
+        self.running = True
+        self.error = ""
+        self.thread = threading.Thread(target=self.run, name=f"serial-{serial.port}", daemon=True)
+        self.reader = threading.Thread(target=self.read, name=f"serial-{serial.port}-reader", daemon=True)
+
+    @property
+    def alive(self) -> bool:
+        """Whether the link still writes to the board."""
+        return self.running and not self.error
+
+    def start(self) -> None:
+        """Starts the writer and reader threads."""
+        self.thread.start()
+        self.reader.start()
+
+    def stop(self) -> None:
+        """Stops the threads and closes the connection."""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+        for thread in (self.thread, self.reader):
+            if thread.is_alive() and thread is not threading.current_thread():
+                thread.join()
+
+        self.serial.close()
+
+    def put(self, channel: int, value: int) -> None:
+        """Sets the value to send on a channel, never waits for the serial port."""
+        with self.condition:
+            if channel in self.mailbox:
+                self.coalesced += 1
+
+            self.mailbox[channel] = value
+            self.condition.notify()
+
+    def take(self, timeout: Optional[float] = None) -> Dict[int, int]:
+        """Waits for values in the mailbox, up to the timeout, and empties it."""
+        with self.condition:
+            if self.running and not self.mailbox:
+                self.condition.wait_for(lambda: not self.running or self.mailbox, timeout)
+
+            mailbox, self.mailbox = self.mailbox, {}
+            return mailbox
+
+    def encode(self, values: Dict[int, int], now: float) -> bytes:
+        """Encodes the values the board does not have yet, or has had for a while."""
+        frames = []
+        for channel, value in values.items():
+            if self.sent.get(channel) == value and now - self.sent_at[channel] < self.resend_interval:
+                self.skipped += 1
+                continue
+
+            frames.append(protocol.encode(channel, value))
+            self.sent[channel], self.sent_at[channel] = value, now
+
+        return b"".join(frames)
+
+    def run(self) -> None:
+        """Writes the mailbox at most once per control period, and a ping every ping interval."""
+        tick = next_ping = time.monotonic()
+        while self.running:
+            timeout = max(next_ping - time.monotonic(), 0) if self.ping_interval else None
+            values = self.take(timeout)
+            data = self.encode(values, time.monotonic())
+            commands = len(data) // protocol.FRAME_SIZE
+
+            if self.ping_interval and time.monotonic() >= next_ping:
+                next_ping = time.monotonic() + self.ping_interval
+                data += protocol.encode(protocol.CHANNEL_PING, self.sequence)
+
+            if data:
+                start = time.perf_counter()
+                try:
+                    self.serial.write(data)
+                except SerialException as e:
+                    self.error = repr(e)
+                    log.warning(f"Lost connection to {self.serial.port}: {e}")
+                    return
+
+                if len(data) > commands * protocol.FRAME_SIZE:
+                    self.pings[self.sequence] = start
+                    self.sequence = (self.sequence + 1) % 256
+
+                self.latencies[self.writes % len(self.latencies)] = time.perf_counter() - start
+                self.writes += 1
+                self.commands += commands
+                self.bytes += len(data)
+
+            # Wait for the next tick, starting again from now if the write overran it.
+            tick = max(tick + self.period, time.monotonic())
+            time.sleep(max(tick - time.monotonic(), 0))
+
+    def read(self) -> None:
+        """Reads the board's replies as they arrive."""
+        while self.running:
+            try:
+                data = self.serial.read(max(self.serial.in_waiting, 1))
+            except (SerialException, OSError, TypeError):
+                # Closing the port interrupts the read.
+                return
+
+            now = time.perf_counter()
+            for channel, value in self.parser.feed(data):
+                if channel == protocol.CHANNEL_PING and value in self.pings:
+                    self.round_trips[self.replies % len(self.round_trips)] = now - self.pings.pop(value)
+                    self.replies += 1
+                elif channel == protocol.CHANNEL_ERRORS:
+                    # The board counts the frames it rejected in a byte, which wraps around.
+                    self.board_errors += (value - self.board_errors) % 256
+
+    def get_rates(self) -> Tuple[float, float]:
+        """Gets the bytes and commands written per second, over windows of a second."""
+        now = time.monotonic()
+        start, written, commands = self.window
+        if now - start >= 1:
+            self.rates = ((self.bytes - written) / (now - start), (self.commands - commands) / (now - start))
+            self.window = (now, self.bytes, self.commands)
+
+        return self.rates
+
+    def get_stats(self) -> dict:
+        """Gets the mailbox depth, write counts, rates, errors and the latencies in milliseconds."""
+        latencies = self.latencies[:min(self.writes, len(self.latencies))] * 1000
+        round_trips = self.round_trips[:min(self.replies, len(self.round_trips))] * 1000
+        bytes_rate, commands_rate = self.get_rates()
+
+        return {
+            "pending": len(self.mailbox),
+            "writes": self.writes,
+            "coalesced": self.coalesced,
+            "skipped": self.skipped,
+            "latency_mean": float(latencies.mean()) if len(latencies) else 0.0,
+            "latency_max": float(latencies.max()) if len(latencies) else 0.0,
+            "round_trip": dict(zip(
+                ("p50", "p90", "p99"),
+                np.percentile(round_trips, (50, 90, 99)).tolist() if len(round_trips) else (0.0, 0.0, 0.0)
+            )),
+            "bytes_per_second": bytes_rate,
+            "commands_per_second": commands_rate,
+            "checksum_errors": self.parser.errors,
+            "board_checksum_errors": self.board_errors
+        }
+
+
+def find_ports() -> Tuple[List[str], List[str]]:
+    """Finds the USB serial ports of known arduino boards, and the other USB serial ports."""
+    known, unknown = [], []
+    for port in sorted(list_ports.comports(), key=lambda port: port.device):
+        # Ports without a USB vendor are built in serial or bluetooth ports.
+        if port.vid is None:
+            continue
+
+        if port.vid in constants.arduino.vendor_ids:
+            known.append(port.device)
+        else:
+            unknown.append(port.device)
+
+    return known, unknown
+
+
+class Board:
+    """A connected arduino board and the link writing to it."""
+
+    def __init__(self, port: str, known: bool = True):
+        self.port = port
+        self.baud_rate = constants.arduino.baud_rate
+        self.servos = 0
+
+        self.serial = Serial(port, constants.arduino.baud_rate, timeout=constants.arduino.handshake_timeout)
+        try:
+            # Other USB serial devices must prove they run the sketch.
+            if not self.wait_ready() and not known:
+                raise SerialException(f"No arduino board replied at port {port}")
+
+            self.negotiate()
+        except BaseException:
+            self.serial.close()
+            raise
+
+        # Replies are read as they arrive, so the timeout only bounds how long closing takes.
+        self.serial.timeout = constants.arduino.ready_poll
+        self.link = SerialLink(self.serial)
+        self.link.start()
+        log.info(f"Connected to arduino board at port {port}")
+
+    def wait_ready(self) -> bool:
+        """Waits for the sketch to announce itself after the board reset, instead of a fixed delay."""
+        parser = protocol.Parser()
+        deadline = time.monotonic() + constants.arduino.ready_timeout
+        queried = False
+
+        self.serial.timeout = constants.arduino.ready_poll
+        while time.monotonic() < deadline:
+            for channel, value in parser.feed(self.serial.read(protocol.FRAME_SIZE)):
+                if channel == protocol.CHANNEL_READY:
+                    self.servos = value
+                    return True
+
+            # Boards that do not reset when the port opens are already running, ask them.
+            if not queried and time.monotonic() > deadline - constants.arduino.ready_timeout / 2:
+                self.serial.write(protocol.encode(protocol.CHANNEL_READY, 0))
+                queried = True
+
+        log.warning(f"Arduino board at port {self.port} did not announce itself")
+        return False
+
+    def negotiate(self) -> None:
+        """Asks the board to switch to the fast baud rate, keeping the current one if it does not reply."""
+        if constants.arduino.fast_baud_rate == self.baud_rate:
+            return
+
+        self.serial.reset_input_buffer()
+        self.serial.timeout = constants.arduino.handshake_timeout
+        self.serial.write(protocol.encode_baud(constants.arduino.fast_baud_rate))
+
+        # The board acknowledges with the same frame before it switches.
+        reply = protocol.Parser().parse(self.serial.read(protocol.FRAME_SIZE))
+        if reply and reply[0][0] == protocol.CHANNEL_BAUD:
+            self.serial.baudrate = self.baud_rate = constants.arduino.baud_rates[reply[0][1]]
+            log.info(f"Switched arduino board at port {self.port} to {self.baud_rate} baud")
+        else:
+            log.warning(
+                f"Arduino board at port {self.port} did not reply to the handshake, staying at {self.baud_rate} baud"
+            )
+
+    def get_latency(self, frames: int = 1) -> float:
+        """Gets the seconds the given number of frames take to go through the serial link."""
+        return protocol.transfer_time(frames, self.baud_rate)
+
+    def close(self) -> None:
+        """Stops the link and closes the connection."""
+        self.link.stop()
@@ -0,0 +1,215 @@
+import logging
+import queue
+import time
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+from app.core import constants
+from app.utils import analysis
+
+log = logging.getLogger(__name__)
+
+
+class Source(ABC):
+    """A source of mono float32 PCM blocks."""
+
+    sample_rate: int = constants.live.sample_rate
+
+    @abstractmethod
+    def start(self) -> None:
+        """Starts producing blocks."""
+
+    @abstractmethod
+    def stop(self) -> None:
+        """Stops producing blocks."""
+
+    @abstractmethod
+    def read(self) -> Optional[np.ndarray]:
+        """Gets the next available block without waiting, or None."""
+
+
+class GeneratorSource(Source):
+    """Reads blocks from an iterable, used to feed recorded or synthetic audio."""
+
+    def __init__(self, blocks: Iterable[np.ndarray], sample_rate: int = constants.live.sample_rate):
+        self.blocks: Iterator[np.ndarray] = iter(blocks)
+        self.sample_rate = sample_rate
+
+    def start(self) -> None:
+        """Nothing to start, the blocks are read on demand."""
+        pass
+
+    def stop(self) -> None:
+        """Nothing to stop."""
+        pass
+
+    def read(self) -> Optional[np.ndarray]:
+        """Gets the next block of the iterable."""
+        return next(self.blocks, None)
+
+
+class FileSource(GeneratorSource):
+    """Reads an audio file as if it was a live input."""
+
+    def __init__(self, file_path: str, block_size: int = constants.live.block_size):
+        time_series, sample_rate = analysis.load(file_path, constants.live.sample_rate)
+        super().__init__(
+            (time_series[i:i + block_size] for i in range(0, len(time_series), block_size)), sample_rate
+        )
+
+
+class MicrophoneSource(Source):
+    """Records the default input device, requires the optional `sounddevice` package."""
+
+    def __init__(self, sample_rate: int = constants.live.sample_rate, block_size: int = constants.live.block_size):
+        import sounddevice
+
+        self.sample_rate = sample_rate
+        self.blocks: queue.Queue = queue.Queue()
+
+        # PortAudio errors, no input device or an unsupported sample rate, are raised as OSError.
+        self.error = sounddevice.PortAudioError
+        try:
+            self.stream = sounddevice.InputStream(
+                samplerate=sample_rate, blocksize=block_size, channels=1, dtype="float32", callback=self.callback
+            )
+        except self.error as e:
+            raise OSError(f"Could not open the input device: {e}") from e
+
+    def callback(self, data: np.ndarray, frames: int, time_info: object, status: object) -> None:
+        """Queues a recorded block, called from the audio thread."""
+        self.blocks.put(data[:, 0].copy())
+
+    def start(self) -> None:
+        """Starts recording."""
+        try:
+            self.stream.start()
+        except self.error as e:
+            self.stream.close()
+            raise OSError(f"Could not start the input device: {e}") from e
+
+    def stop(self) -> None:
+        """Stops recording."""
+        self.stream.stop()
+        self.stream.close()
+
+    def read(self) -> Optional[np.ndarray]:
+        """Gets the next recorded block."""
+        try:
+            return self.blocks.get_nowait()
+        except queue.Empty:
+            return None
+
+
+class LiveAnalyzer:
+    """Analyses a live source into bar dBs, keeping the last `n_fft` samples in a ring buffer."""
+
+    def __init__(
+            self, source: Source, n_fft: int = constants.live.n_fft, hop_length: int = constants.live.hop_length,
+            max_backlog: int = constants.live.max_backlog
+    ):
+        self.source = source
+        self.n_fft, self.hop_length, self.max_backlog = n_fft, hop_length, max_backlog
+
+        self.ring = np.zeros(n_fft, dtype=np.float32)
+        self.position = 0  # Next sample to write in the ring.
+        self.pending = 0  # Samples received since the last frame.
+
+        self.window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+        self.matrix = analysis.band_matrix(source.sample_rate, analysis.bar_frequencies(), n_fft)
+
+        # The latest frame, and the number of frames analysed so far.
+        self.frame = np.full(len(analysis.bar_frequencies()), constants.visualizer.default_db, dtype=np.int8)
+        self.frames = 0
+
+        # Latency of the recent processed blocks and the budget each has, the duration of the block.
+        self.latencies = np.zeros(constants.latency.jitter_window, dtype=np.float64)
+        self.budgets = np.zeros(constants.latency.jitter_window, dtype=np.float64)
+        self.blocks = 0
+        self.over_budget = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """Starts the source."""
+        self.source.start()
+
+    def stop(self) -> None:
+        """Stops the source."""
+        self.source.stop()
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Writes a block to the ring buffer, returning the (frames, bands) dBs of the frames it completed."""
+        start = time.perf_counter()
+        frames = []
+
+        # Split the block at the hops, so frames end on a hop whatever the block size.
+        sample = 0
+        while sample < len(block):
+            chunk = block[sample:sample + self.hop_length - self.pending]
+            self.write(chunk)
+            self.pending += len(chunk)
+            sample += len(chunk)
+
+            if self.pending == self.hop_length:
+                self.pending = 0
+                frames.append(self.analyse())
+
+        if frames:
+            self.frame = frames[-1]
+            self.frames += len(frames)
+
+        latency, budget = time.perf_counter() - start, len(block) / self.source.sample_rate
+        self.latencies[self.blocks % len(self.latencies)] = latency
+        self.budgets[self.blocks % len(self.budgets)] = budget
+        self.over_budget += latency > budget
+        self.blocks += 1
+        return np.array(frames, dtype=np.int8).reshape(-1, len(self.frame))
+
+    def write(self, chunk: np.ndarray) -> None:
+        """Writes samples to the ring buffer, overwriting the oldest."""
+        chunk = chunk[-self.n_fft:]
+        end = self.position + len(chunk)
+        if end <= self.n_fft:
+            self.ring[self.position:end] = chunk
+        else:
+            split = self.n_fft - self.position
+            self.ring[self.position:] = chunk[:split]
+            self.ring[:end - self.n_fft] = chunk[split:]
+
+        self.position = end % self.n_fft
+
+    def analyse(self) -> np.ndarray:
+        """Analyses the last `n_fft` samples into band dBs."""
+        samples = np.roll(self.ring, -self.position) * self.window
+        magnitudes = np.abs(np.fft.rfft(samples))[:, np.newaxis]
+        return analysis.band_dbfs(magnitudes, self.matrix, self.n_fft)[0]
+
+    def poll(self) -> np.ndarray:
+        """Processes the blocks the source has ready, dropping a backlog that would add latency."""
+        blocks = []
+        while (block := self.source.read()) is not None:
+            blocks.append(block)
+
+        if len(blocks) > self.max_backlog:
+            self.dropped += len(blocks) - self.max_backlog
+            blocks = blocks[-self.max_backlog:]
+
+        for block in blocks:
+            self.process(block)
+
+        return self.frame
+
+    def get_latency(self) -> dict:
+        """Gets statistics of the recent block processing latency against the block duration."""
+        count = max(min(self.blocks, len(self.latencies)), 1)
+        latencies, budgets = self.latencies[:count], self.budgets[:count]
+        return {
+            "mean": float(latencies.mean()),
+            "p99": float(np.percentile(latencies, 99)),
+            "max": float(latencies.max()),
+            "budget": float(budgets.mean()),
+            "over_budget": self.over_budget,
+            "dropped": self.dropped
+        }
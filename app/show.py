@@ -0,0 +1,133 @@
+import logging
+import struct
+
+import numpy as np
+
+from app.core import constants
+from app.timeline import Timeline
+from app.utils.arduino import rotation_table
+
+log = logging.getLogger(__name__)
+
+# Header of a compiled show, followed by the servo and stream offset of every channel.
+MAGIC = b"AT"
+VERSION = 1
+HEADER = struct.Struct("<2sBBBH")
+CHANNEL = struct.Struct("<BH")
+
+# Codes below DELTA hold the angle for code + 1 steps, the others set it for one step.
+DELTA = 0x80  # Codes from here to ABSOLUTE add code - DELTA - 32 to the angle.
+ABSOLUTE = 0xC0  # Followed by the angle.
+MAX_RUN = DELTA
+
+
+def sample(timeline: Timeline, time_index_ratio: float, rate: int, lookahead: float) -> np.ndarray:
+    """Gets the (steps, channels) angles of a timeline at the control rate, ahead of the audio by the lookahead."""
+    steps = int(timeline.frames / time_index_ratio * rate)
+    frames = ((np.arange(steps) / rate + lookahead) * time_index_ratio).astype(np.intp)
+    return timeline.angles[np.clip(frames, 0, timeline.frames - 1)]
+
+
+def encode_stream(angles: np.ndarray) -> bytes:
+    """Delta encodes the angles of a channel, holding unchanged angles in runs."""
+    stream = bytearray()
+    angle = -1
+    run = 0
+    for value in angles.tolist():
+        if value == angle:
+            run += 1
+            if run == MAX_RUN:
+                stream.append(run - 1)
+                run = 0
+            continue
+
+        if run:
+            stream.append(run - 1)
+            run = 0
+
+        delta = value - angle
+        if angle >= 0 and -32 <= delta < 32:
+            stream.append(DELTA + delta + 32)
+        else:
+            stream += bytes((ABSOLUTE, value))
+
+        angle = value
+
+    if run:
+        stream.append(run - 1)
+
+    return bytes(stream)
+
+
+def compile_show(
+        timeline: Timeline, time_index_ratio: float, rate: int = constants.arduino.show_rate,
+        lookahead: float = constants.latency.servo
+) -> bytes:
+    """Compiles the angles of every channel on the first board into a show the sketch plays on its own."""
+    channels = [(index, channel) for index, channel in enumerate(rotation_table.channels) if channel.board == 0]
+    angles = sample(timeline, time_index_ratio, rate, lookahead)
+    if len(angles) > 0xFFFF:
+        raise ValueError(f"Show of {len(angles)} steps is too long, lower the control rate")
+
+    streams = [encode_stream(angles[:, index]) for index, _ in channels]
+    offset = HEADER.size + CHANNEL.size * len(channels)
+
+    data = bytearray(HEADER.pack(MAGIC, VERSION, rate, len(channels), len(angles)))
+    for (_, channel), stream in zip(channels, streams):
+        data += CHANNEL.pack(channel.servo, offset)
+        offset += len(stream)
+
+    data += b"".join(streams)
+    if len(data) > constants.arduino.show_size_limit:
+        raise ValueError(
+            f"Show of {len(data)} bytes does not fit in {constants.arduino.show_size_limit} bytes, "
+            "lower the control rate"
+        )
+
+    return bytes(data)
+
+
+def play(data: bytes) -> np.ndarray:
+    """Plays a compiled show the way the sketch does, returning the (steps, channels) angles it writes."""
+    magic, version, rate, count, steps = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a compiled show")
+
+    angles = np.zeros((steps, count), dtype=np.int16)
+    for index in range(count):
+        _, position = CHANNEL.unpack_from(data, HEADER.size + CHANNEL.size * index)
+        angle, hold = 0, 0
+
+        for step in range(steps):
+            # A run holds the angle, every other code sets it for one step.
+            if hold:
+                hold -= 1
+            else:
+                code = data[position]
+                position += 1
+
+                if code < DELTA:
+                    hold = code
+                elif code < ABSOLUTE:
+                    angle += code - DELTA - 32
+                else:
+                    angle = data[position]
+                    position += 1
+
+            angles[step, index] = angle
+
+    return angles
+
+
+def export(file_path: str, data: bytes) -> None:
+    """Writes a compiled show as a header for the sketch's flash, and next to it as a binary for its EEPROM."""
+    lines = [", ".join(f"0x{byte:02x}" for byte in data[i:i + 16]) for i in range(0, len(data), 16)]
+    with open(file_path, "w") as f:
+        f.write("// Compiled by the animatronic control panel, see app/show.py for the format.\n")
+        f.write(f"const uint8_t SHOW[{len(data)}] PROGMEM = {{\n  " + ",\n  ".join(lines) + "\n};\n")
+
+    with open(f"{file_path.rsplit('.', 1)[0]}.bin", "wb") as f:
+        f.write(data)
+
+    fits = "fits" if len(data) <= constants.arduino.eeprom_size else "does not fit"
+    log.info(f"Exported a show of {len(data)} bytes to {file_path}, it {fits} in the EEPROM")
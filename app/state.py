@@ -5,6 +5,8 @@ from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple
 
 from app.core import settings
+from app.utils.channels import Channel
+from app.utils.maths import AllowedRotations
 
 log = logging.getLogger(__name__)
 
@@ -13,9 +15,12 @@ class State:
     """Groups together the global state of the game."""
 
     def __init__(self):
-        self.allowed_rotations: List[int] = []
+        self.allowed_rotations = AllowedRotations()
         self.rotations_range: Tuple[int, int] = (0, 180)
 
+        # Servos besides the main one, which follows every bar and is set up in the UI.
+        self.channels: List[Channel] = []
+
         self.holding_mouse: bool = False
         self.mouse_pos: Tuple[int, int] = (0, 0)
 
@@ -29,10 +34,6 @@ class State:
         # Load default profile.
         self.load()
 
-        # Animations.
-        self.loading: bool = False
-        self.loading_frame: str = ""
-
     def load(self) -> None:
         """Load the servo's settings from the profile."""
         try:
@@ -41,15 +42,25 @@ class State:
 
                 # Load profile settings.
                 self.rotations_range = (config["rotations"]["min"], config["rotations"]["max"])
-                self.allowed_rotations = config["rotations"]["allowed"]
+                self.allowed_rotations = AllowedRotations(config["rotations"]["allowed"])
 
                 self.min_dbfs, self.max_dbfs = config["dbfs"]["min"], config["dbfs"]["max"]
+                self.channels = []
+                for channel in config.get("channels", []):
+                    try:
+                        self.channels.append(Channel.from_config(channel))
+                    except (KeyError, ValueError) as e:
+                        log.warning(f"Ignoring invalid channel {channel.get('name')} in profile: {e!r}")
 
             log.info(f"Loaded profile from {self.cache_dir}/profile.json")
         except FileNotFoundError:
             log.warning(f"Profile not found in {self.cache_dir}/profile.json, creating profile")
             self.save()
 
+    def get_channels(self) -> List[Channel]:
+        """Gets every output channel, the main servo first."""
+        return [Channel("main", 0, 0, None, self.rotations_range, self.allowed_rotations), *self.channels]
+
     def save(self) -> None:
         """Save the servo's angle to the given config."""
         # Create the cache directory if it doesn't exist.
@@ -61,12 +72,13 @@ class State:
                 "rotations": {
                     "min": self.rotations_range[0],
                     "max": self.rotations_range[1],
-                    "allowed": self.allowed_rotations
+                    "allowed": list(self.allowed_rotations)
                 },
                 "dbfs": {
                     "min": self.min_dbfs,
                     "max": self.max_dbfs
-                }
+                },
+                "channels": [channel.to_config() for channel in self.channels]
             }, f
             )
 
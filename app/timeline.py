@@ -0,0 +1,70 @@
+import logging
+from typing import Tuple
+
+import numpy as np
+
+from app.core import constants
+from app.utils.arduino import rotation_table
+
+log = logging.getLogger(__name__)
+
+
+class Timeline:
+    """The servo trajectories of an audio file, one average dB and angle per channel and spectrogram frame."""
+
+    def __init__(self):
+        self.envelope = np.empty((0, 0), dtype=np.float32)
+        self.angles = np.empty((0, 0), dtype=np.int16)
+        self.frames = 0
+
+        # The rotation table version the angles were computed with, and the angles of frames that are not analysed.
+        self.version = 0
+        self.silence: Tuple[float, int] = (constants.visualizer.default_db, 0)
+        self.silent_angles = np.zeros(0, dtype=np.int16)
+
+    def update(self, spectrogram: np.ndarray, analysed_frames: int) -> None:
+        """Computes the newly analysed frames, and every frame again if the profile changed."""
+        version = rotation_table.update()
+        shape = (len(spectrogram), len(rotation_table.channels))
+        if self.envelope.shape != shape or version != self.version:
+            self.envelope = np.full(shape, constants.visualizer.default_db, dtype=np.float32)
+            self.angles = np.zeros(shape, dtype=np.int16)
+            self.frames = 0
+
+        start = self.frames
+        if start < analysed_frames:
+            self.envelope[start:analysed_frames] = rotation_table.get_envelope(spectrogram[start:analysed_frames])
+            self.angles[start:analysed_frames] = rotation_table.lookup(self.envelope[start:analysed_frames])
+
+        if version != self.version:
+            silence = constants.visualizer.default_db
+            self.silent_angles = rotation_table.lookup(np.full(shape[1], silence))
+            self.silence = (silence, int(self.silent_angles[0]))
+            self.version = version
+
+        self.frames = analysed_frames
+
+    def get(self, frame: int) -> Tuple[float, int]:
+        """Gets the average dB and the angle of the main channel at a frame."""
+        if not 0 <= frame < self.frames:
+            return self.silence
+
+        return float(self.envelope[frame, 0]), int(self.angles[frame, 0])
+
+    def get_angles(self, frame: int) -> np.ndarray:
+        """Gets the angle of every channel at a frame."""
+        if not 0 <= frame < self.frames:
+            return self.silent_angles
+
+        return self.angles[frame]
+
+    def export(self, file_path: str, time_index_ratio: float) -> None:
+        """Exports the analysed frames as a CSV of time, average dB and the angle of every channel."""
+        times = np.arange(self.frames) / time_index_ratio
+        names = ["angle", *(channel.name for channel in rotation_table.channels[1:])]
+        np.savetxt(
+            file_path, np.column_stack((times, self.envelope[:self.frames, 0], self.angles[:self.frames])),
+            fmt=("%.4f", "%.2f", *("%d" for _ in names)), delimiter=",", header=",".join(["time", "db", *names]),
+            comments=""
+        )
+        log.info(f"Exported timeline to {file_path}")
@@ -0,0 +1,143 @@
+import logging
+from typing import Iterator, Optional, Tuple
+
+import librosa
+import numpy as np
+import soundfile
+
+from app.core import constants
+
+log = logging.getLogger(__name__)
+
+# Fast resampler, librosa's default before 0.10 is resampy's much slower kaiser_best.
+try:
+    import soxr  # noqa: F401
+
+    FAST_RES_TYPE = "soxr_hq"
+except ModuleNotFoundError:
+    FAST_RES_TYPE = "polyphase"
+
+
+def bar_frequencies() -> np.ndarray:
+    """Get the center frequencies of the visualizer bars."""
+    return np.arange(*constants.visualizer.frequency_range, constants.visualizer.frequency_step)
+
+
+def band_matrix(
+        sample_rate: int, frequencies: np.ndarray, n_fft: int = constants.analysis.n_fft
+) -> np.ndarray:
+    """Get a (bins, bands) matrix summing the STFT bins around each center frequency into its band."""
+    # Band edges sit halfway between the centers, the outer edges are mirrored.
+    middles = (frequencies[1:] + frequencies[:-1]) / 2
+    edges = np.concatenate((
+        [frequencies[0] - (middles[0] - frequencies[0])], middles, [frequencies[-1] + (frequencies[-1] - middles[-1])]
+    )) if len(frequencies) > 1 else np.array([0, frequencies[0] * 2])
+
+    bins = librosa.core.fft_frequencies(sr=sample_rate, n_fft=n_fft)
+    band = np.searchsorted(edges, bins, side="right") - 1
+
+    matrix = np.zeros((len(bins), len(frequencies)), dtype=np.float32)
+    inside = (band >= 0) & (band < len(frequencies))
+    matrix[np.flatnonzero(inside), band[inside]] = 1
+    return matrix
+
+
+def frame_count(samples: int, hop_length: int = constants.analysis.hop_length) -> int:
+    """Get the number of centered STFT frames of a signal."""
+    return 1 + samples // hop_length
+
+
+def pad(time_series: np.ndarray, n_fft: int = constants.analysis.n_fft) -> np.ndarray:
+    """Pad a signal the same way a centered STFT does, so it can be analysed in blocks."""
+    return np.pad(time_series, n_fft // 2, mode="constant")
+
+
+def stft_block(
+        padded: np.ndarray, start: int, stop: int,
+        n_fft: int = constants.analysis.n_fft, hop_length: int = constants.analysis.hop_length
+) -> np.ndarray:
+    """Get the STFT magnitudes of the frames `start` to `stop` of a padded signal."""
+    segment = padded[start * hop_length:(stop - 1) * hop_length + n_fft]
+    return np.abs(librosa.stft(segment, n_fft=n_fft, hop_length=hop_length, center=False))
+
+
+def band_dbfs(
+        magnitudes: np.ndarray, matrix: np.ndarray, n_fft: int = constants.analysis.n_fft,
+        floor: int = constants.visualizer.default_db
+) -> np.ndarray:
+    """Reduce (bins, frames) STFT magnitudes to quantised (frames, bands) band energies in dBFS."""
+    power = np.square(magnitudes, dtype=np.float32).T @ matrix
+
+    # Energy of a full scale sine summed over all of its bins (Parseval).
+    window = librosa.filters.get_window("hann", n_fft, fftbins=True)
+    ref = n_fft * np.sum(np.square(window)) / 4
+
+    db = librosa.power_to_db(power, ref=ref, top_db=None)
+    return np.clip(np.rint(db), floor, np.iinfo(np.int8).max).astype(np.int8)
+
+
+def decode(file_path: str, block_size: int = constants.analysis.decode_block_size) -> Tuple[np.ndarray, int]:
+    """Decodes an audio file block by block to a float32 mono signal at its native sample rate."""
+    with soundfile.SoundFile(file_path) as f:
+        blocks = [
+            np.mean(block, axis=1, dtype=np.float32)
+            for block in f.blocks(block_size, dtype="float32", always_2d=True)
+        ]
+
+        return np.concatenate(blocks) if blocks else np.empty(0, dtype=np.float32), f.samplerate
+
+
+def load(
+        file_path: str, sample_rate: Optional[int] = constants.analysis.sample_rate,
+        res_type: Optional[str] = constants.analysis.res_type
+) -> Tuple[np.ndarray, int]:
+    """Decodes an audio file to a mono signal, resampled to the sample rate unless it is None."""
+    res_type = res_type or FAST_RES_TYPE
+
+    try:
+        time_series, native_rate = decode(file_path)
+    except RuntimeError as e:
+        # Formats libsndfile can not read go through librosa's audioread fallback.
+        log.debug(f"Falling back to librosa to decode {file_path}: {e}")
+        return librosa.load(file_path, sr=sample_rate, res_type=res_type)
+
+    if sample_rate is None or sample_rate == native_rate:
+        return time_series, native_rate
+
+    resampled = librosa.resample(time_series, orig_sr=native_rate, target_sr=sample_rate, res_type=res_type)
+    return resampled.astype(np.float32, copy=False), sample_rate
+
+
+def get_ratios(frames: int, sample_rate: int, hop_length: int = constants.analysis.hop_length) -> dict:
+    """Get the ratios converting times to frames and frequencies to bands."""
+    times = librosa.core.frames_to_time(np.arange(frames), sr=sample_rate, hop_length=hop_length)
+    return {
+        "time_index_ratio": len(times) / max(times[len(times) - 1], 1 / sample_rate),
+        "frequencies_index_ratio": 1 / constants.visualizer.frequency_step
+    }
+
+
+def blocks(
+        time_series: np.ndarray, sample_rate: int, block_frames: int = constants.analysis.block_frames,
+        n_fft: int = constants.analysis.n_fft, hop_length: int = constants.analysis.hop_length
+) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """Analyses a signal in blocks, yielding the first and last frames of each block and its band dBs."""
+    padded = pad(time_series, n_fft)
+    frames = frame_count(len(time_series), hop_length)
+    matrix = band_matrix(sample_rate, bar_frequencies(), n_fft)
+
+    for start in range(0, frames, block_frames):
+        stop = min(start + block_frames, frames)
+        yield start, stop, band_dbfs(stft_block(padded, start, stop, n_fft, hop_length), matrix, n_fft)
+
+
+def analyse(file_path: str) -> Tuple[np.ndarray, dict]:
+    """Analyses a whole audio file, returning its (frames, bands) spectrogram and ratios."""
+    time_series, sample_rate = load(file_path)
+    frames = frame_count(len(time_series))
+
+    spectrogram = np.empty((frames, len(bar_frequencies())), dtype=np.int8)
+    for start, stop, block in blocks(time_series, sample_rate):
+        spectrogram[start:stop] = block
+
+    return spectrogram, get_ratios(frames, sample_rate)
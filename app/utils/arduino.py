@@ -1,23 +1,92 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
 from app.state import state
-from app.utils.maths import closest
+from app.utils.channels import Channel
+from app.utils.maths import AllowedRotations, nearest
 
 
-def get_rotation(db: int) -> int:
-    """Get a servo rotation for a chunk of audio."""
+def get_rotations(
+        db: np.ndarray, rotations_range: Optional[Tuple[int, int]] = None,
+        allowed_rotations: Optional[AllowedRotations] = None
+) -> np.ndarray:
+    """Get the servo rotations for an array of dBs, truncated to whole degrees."""
+    low, high = rotations_range or state.rotations_range
+    allowed_rotations = allowed_rotations if allowed_rotations is not None else state.allowed_rotations
+
     # Calculate rotation based on the dB of the chunk.
-    rotation_step = (state.rotations_range[1] - state.rotations_range[0]) / (state.min_dbfs - state.max_dbfs)
-    rotation = state.rotations_range[1] + (state.max_dbfs - db) * rotation_step
+    rotation_step = (high - low) / (state.min_dbfs - state.max_dbfs)
+    rotations = high + (state.max_dbfs - np.asarray(db, dtype=np.float64)) * rotation_step
+
+    closest_rotations = nearest(allowed_rotations.sorted.astype(np.float64), rotations)
+
+    # Make sure the rotation is within the allowed range, or make it a multiple of 5.
+    fallback = np.where(
+        rotations < low, low, np.where(rotations > high, high, rotations - np.mod(rotations, 5))
+    )
+    return np.where((low <= closest_rotations) & (closest_rotations <= high), closest_rotations, fallback).astype(
+        np.int16
+    )
+
+
+class RotationTable:
+    """Lookup table of every channel's rotation for each quantised band dB, rebuilt when the profile changes."""
+
+    def __init__(self, low: int = -128, high: int = 127):
+        self.low, self.high = low, high
+
+        # The (bars, channels) mask summing each channel's band, and the number of bars in it.
+        self.channels: List[Channel] = []
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.steps = np.empty(0, dtype=np.int64)
+
+        # The average of `steps` int8 dBs is a multiple of 1 / steps, so such averages are looked up exactly.
+        self.table = np.empty((0, 0), dtype=np.int16)
+
+        self.profile: tuple = ()
+        self.version = 0
+
+    @staticmethod
+    def get_profile() -> tuple:
+        """Gets the profile settings the rotations depend on."""
+        return state.min_dbfs, state.max_dbfs, tuple(channel.get_profile() for channel in state.get_channels())
+
+    def update(self) -> int:
+        """Rebuilds the table if the profile changed, and returns its version."""
+        profile = self.get_profile()
+        if profile == self.profile:
+            return self.version
+
+        self.channels = state.get_channels()
+        masks = np.stack([channel.get_mask() for channel in self.channels], axis=1)
+        self.matrix = masks.astype(np.float32)
+        self.steps = masks.sum(axis=0)
+
+        # Rows are padded with their loudest rotation, so clipped indexes land on it.
+        self.table = np.empty((len(self.channels), (self.high - self.low) * self.steps.max() + 1), dtype=np.int16)
+        for row, (channel, steps) in enumerate(zip(self.channels, self.steps.tolist())):
+            rotations = get_rotations(
+                np.arange(self.low * steps, self.high * steps + 1) / steps,
+                channel.rotations_range, channel.allowed_rotations
+            )
+            self.table[row, :len(rotations)] = rotations
+            self.table[row, len(rotations):] = rotations[-1]
+
+        self.profile = profile
+        self.version += 1
+        return self.version
 
-    closest_rotation = closest(state.allowed_rotations, rotation)
-    if state.rotations_range[0] <= closest_rotation <= state.rotations_range[1]:
-        return closest_rotation
+    def get_envelope(self, spectrogram: np.ndarray) -> np.ndarray:
+        """Gets the (frames, channels) average dB of each channel's band from (frames, bars) dBs."""
+        self.update()
+        return (np.asarray(spectrogram, dtype=np.float32) @ self.matrix) / self.steps.astype(np.float32)
 
-    # Make sure the rotation is within the allowed range.
-    if rotation < state.rotations_range[0]:
-        return state.rotations_range[0]
+    def lookup(self, db: np.ndarray) -> np.ndarray:
+        """Gets the rotations of an array of (..., channels) band dBs."""
+        self.update()
+        index = np.rint((np.asarray(db, dtype=np.float64) - self.low) * self.steps).astype(np.intp)
+        return self.table[np.arange(len(self.channels)), np.clip(index, 0, self.table.shape[1] - 1)]
 
-    if rotation > state.rotations_range[1]:
-        return state.rotations_range[1]
 
-    # Make rotation a multiple of 5.
-    return rotation - (rotation % 5)
+rotation_table = RotationTable()
@@ -0,0 +1,59 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.utils.analysis import bar_frequencies
+from app.utils.maths import AllowedRotations
+
+
+class Channel:
+    """An output servo, driven by the average dB of a band of the visualizer frequencies."""
+
+    def __init__(
+            self, name: str, board: int = 0, servo: int = 0, frequencies: Optional[Tuple[int, int]] = None,
+            rotations_range: Tuple[int, int] = (0, 180), allowed_rotations: Optional[AllowedRotations] = None
+    ):
+        # Boards are numbered in the order they are connected, servos are the channels of the board's protocol.
+        self.name, self.board, self.servo = name, board, servo
+
+        bars = bar_frequencies()
+        self.frequencies = tuple(frequencies) if frequencies else (int(bars[0]), int(bars[-1]))
+        self.rotations_range = tuple(rotations_range)
+        self.allowed_rotations = allowed_rotations if allowed_rotations is not None else AllowedRotations()
+
+        if not self.get_mask().any():
+            raise ValueError(f"Channel {name} has no bars between {self.frequencies[0]} and {self.frequencies[1]} Hz")
+
+    def get_mask(self) -> np.ndarray:
+        """Gets which bars the channel averages."""
+        bars = bar_frequencies()
+        return (bars >= self.frequencies[0]) & (bars <= self.frequencies[1])
+
+    def get_profile(self) -> tuple:
+        """Gets the settings the channel's rotations depend on."""
+        allowed = self.allowed_rotations
+        return self.board, self.servo, self.frequencies, self.rotations_range, id(allowed), allowed.version
+
+    @classmethod
+    def from_config(cls, config: dict) -> "Channel":
+        """Creates a channel from its profile settings."""
+        return cls(
+            config["name"], config.get("board", 0), config["servo"],
+            (config["frequencies"]["min"], config["frequencies"]["max"]),
+            (config["rotations"]["min"], config["rotations"]["max"]),
+            AllowedRotations(config["rotations"]["allowed"])
+        )
+
+    def to_config(self) -> dict:
+        """Gets the channel's profile settings."""
+        return {
+            "name": self.name,
+            "board": self.board,
+            "servo": self.servo,
+            "frequencies": {"min": self.frequencies[0], "max": self.frequencies[1]},
+            "rotations": {
+                "min": self.rotations_range[0],
+                "max": self.rotations_range[1],
+                "allowed": list(self.allowed_rotations)
+            }
+        }
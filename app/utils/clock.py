@@ -0,0 +1,87 @@
+import time
+from typing import Optional
+
+import numpy as np
+
+from app.core import constants
+
+
+def get_lookahead(frequency: int, serial_latency: float) -> float:
+    """Gets the seconds between sending an angle and the servo reaching it, minus the audio output delay."""
+    if constants.latency.lookahead is not None:
+        return constants.latency.lookahead
+
+    # The mixer position runs ahead of the speakers by the audio buffer, so the servo has that much less to catch up.
+    return serial_latency + constants.latency.servo - constants.latency.mixer_buffer / frequency
+
+
+class PlaybackClock:
+    """Smooth playback position following the coarse mixer position with a monotonic clock."""
+
+    def __init__(
+            self, drift_gain: float = constants.latency.drift_gain,
+            resync_threshold: float = constants.latency.resync_threshold
+    ):
+        self.drift_gain, self.resync_threshold = drift_gain, resync_threshold
+
+        # Playback position at the anchor time, None until the clock follows a playing mixer.
+        self.anchor_time = 0.0
+        self.anchor_position: Optional[float] = None
+
+    def reset(self) -> None:
+        """Stops following the mixer, for a pause or a stop."""
+        self.anchor_position = None
+
+    def update(self, mixer_position: float, now: Optional[float] = None) -> float:
+        """Gets the playback position, correcting the drift against the given mixer position."""
+        now = time.perf_counter() if now is None else now
+        if mixer_position < 0:
+            self.reset()
+            return mixer_position
+
+        if self.anchor_position is None:
+            self.anchor_time, self.anchor_position = now, mixer_position
+            return mixer_position
+
+        position = self.anchor_position + now - self.anchor_time
+        error = mixer_position - position
+
+        # Seeks and stalls jump to the mixer position, otherwise the error is corrected a little at a time.
+        if abs(error) > self.resync_threshold:
+            position = mixer_position
+        else:
+            position += error * self.drift_gain
+
+        self.anchor_time, self.anchor_position = now, position
+        return position
+
+
+class Jitter:
+    """Statistics of the intervals between recent events."""
+
+    def __init__(self, size: int = constants.latency.jitter_window):
+        self.intervals = np.zeros(size, dtype=np.float64)
+        self.count = 0
+        self.last: Optional[float] = None
+
+    def reset(self) -> None:
+        """Starts a new series, the next event does not count as an interval."""
+        self.last = None
+
+    def record(self, now: Optional[float] = None) -> None:
+        """Records an event."""
+        now = time.perf_counter() if now is None else now
+        if self.last is not None:
+            self.intervals[self.count % len(self.intervals)] = now - self.last
+            self.count += 1
+
+        self.last = now
+
+    def get_stats(self) -> dict:
+        """Gets the mean interval, its standard deviation and the largest deviation, in milliseconds."""
+        intervals = self.intervals[:min(self.count, len(self.intervals))] * 1000
+        if not len(intervals):
+            return {"mean": 0.0, "std": 0.0, "max": 0.0}
+
+        mean = float(intervals.mean())
+        return {"mean": mean, "std": float(intervals.std()), "max": float(np.abs(intervals - mean).max())}
@@ -1,17 +1,70 @@
-def clamp(min_value: float, max_value: float, value: float) -> float:
-    """Clamps a value between a minimum and maximum value."""
-    if value < min_value:
-        return min_value
+from typing import Iterable, Iterator
 
-    if value > max_value:
-        return max_value
+import numpy as np
 
-    return value
 
+class AllowedRotations:
+    """A set of servo rotations from 0 to 180, held as a bitset with a table of the nearest allowed rotation."""
 
-def closest(lst: list, k: int) -> int:
-    """Get the closest value in a list."""
-    try:
-        return lst[min(range(len(lst)), key=lambda i: abs(lst[i] - k))]
-    except ValueError:
-        return k
+    size = 181
+
+    def __init__(self, rotations: Iterable[int] = ()):
+        self.bits = np.zeros(self.size, dtype=bool)
+        for rotation in rotations:
+            if 0 <= rotation < self.size:
+                self.bits[int(rotation)] = True
+
+        # Bumped on every change so lookup tables built from the set know when to rebuild.
+        self.version = 0
+        self.sorted = np.empty(0, dtype=np.int16)
+        self.nearest = np.arange(self.size, dtype=np.int16)
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        """Rebuilds the sorted rotations and the nearest rotation of every angle, ties go to the lower one."""
+        self.sorted = np.flatnonzero(self.bits).astype(np.int16)
+        self.nearest = nearest(self.sorted, np.arange(self.size)).astype(np.int16)
+        self.version += 1
+
+    def __contains__(self, rotation: int) -> bool:
+        return 0 <= rotation < self.size and bool(self.bits[int(rotation)])
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.sorted.tolist())
+
+    def __len__(self) -> int:
+        return len(self.sorted)
+
+    def add(self, rotation: int) -> None:
+        """Allows a rotation."""
+        self.bits[rotation] = True
+        self.rebuild()
+
+    def remove(self, rotation: int) -> None:
+        """Disallows a rotation."""
+        self.bits[rotation] = False
+        self.rebuild()
+
+    def toggle(self, rotation: int) -> None:
+        """Allows a rotation if it is not allowed, and disallows it otherwise."""
+        self.bits[rotation] = not self.bits[rotation]
+        self.rebuild()
+
+    def snap(self, rotation: int, distance: int) -> int:
+        """Gets the nearest allowed rotation if it is within the distance, and the rotation itself otherwise."""
+        if not self or not 0 <= rotation < self.size:
+            return rotation
+
+        allowed = int(self.nearest[rotation])
+        return allowed if abs(allowed - rotation) <= distance else rotation
+
+
+def nearest(values: np.ndarray, k: np.ndarray) -> np.ndarray:
+    """Get the closest of the sorted values to each k, ties go to the lower value."""
+    if not len(values):
+        return np.asarray(k)
+
+    index = np.searchsorted(values, k)
+    lower = values[np.clip(index - 1, 0, len(values) - 1)]
+    upper = values[np.clip(index, 0, len(values) - 1)]
+    return np.where(upper - k < k - lower, upper, lower)
@@ -0,0 +1,64 @@
+from typing import Iterator, List, Tuple
+
+from app.core import constants
+
+# Every frame is the sync byte, a channel, a value and a checksum of the channel and value.
+SYNC = 0xA5
+FRAME_SIZE = 4
+
+# Channels from here on are commands instead of servos.
+CHANNEL_PLAY = 0xFA
+CHANNEL_ERRORS = 0xFB
+CHANNEL_PING = 0xFC
+CHANNEL_READY = 0xFD
+CHANNEL_BAUD = 0xFE
+
+
+def checksum(channel: int, value: int) -> int:
+    """Gets the checksum of a frame, the complement of the sum of its channel and value."""
+    return ~(channel + value) & 0xFF
+
+
+def encode(channel: int, value: int) -> bytes:
+    """Encodes a frame setting the value of a channel."""
+    return bytes((SYNC, channel, value, checksum(channel, value)))
+
+
+def encode_baud(baud_rate: int) -> bytes:
+    """Encodes a request for the board to switch to one of the supported baud rates."""
+    return encode(CHANNEL_BAUD, constants.arduino.baud_rates.index(baud_rate))
+
+
+def transfer_time(frames: int, baud_rate: int) -> float:
+    """Gets the seconds frames take to go through a serial link, 10 bits a byte."""
+    return frames * FRAME_SIZE * 10 / baud_rate
+
+
+class Parser:
+    """Non-blocking frame parser, the same state machine as the firmware's."""
+
+    def __init__(self):
+        self.state = 0  # Bytes of the current frame read so far.
+        self.channel = self.value = 0
+        self.errors = 0
+
+    def feed(self, data: bytes) -> Iterator[Tuple[int, int]]:
+        """Reads any number of bytes, yielding the channel and value of every complete frame."""
+        for byte in data:
+            if self.state == 0:
+                if byte == SYNC:
+                    self.state = 1
+            elif self.state == 1:
+                self.channel, self.state = byte, 2
+            elif self.state == 2:
+                self.value, self.state = byte, 3
+            else:
+                self.state = 0
+                if byte == checksum(self.channel, self.value):
+                    yield self.channel, self.value
+                else:
+                    self.errors += 1
+
+    def parse(self, data: bytes) -> List[Tuple[int, int]]:
+        """Reads any number of bytes, returning the frames they complete."""
+        return list(self.feed(data))
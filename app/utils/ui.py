@@ -1,13 +1,15 @@
 import math
-import tkinter as tk
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from tkinter.filedialog import askopenfilename
-from typing import Tuple
+from typing import Hashable, List, Optional, Sequence, Tuple
 
 import pygame
-from pygame import Surface
+from pygame import Rect, Surface
+from pygame.font import Font
 
 from app.core import constants, settings
+from app.state import state
 
 
 def draw_pie(radius: int, color: tuple, start_angle: int, end_angle: int, width: int = 0) -> Surface:
@@ -39,21 +41,139 @@ def draw_pie(radius: int, color: tuple, start_angle: int, end_angle: int, width:
     return surf
 
 
-def draw_triangle(color: tuple, a: Tuple[int, int], b: Tuple[int, int], c: Tuple[int, int]) -> Surface:
-    """Draw a triangle."""
+def draw_triangle(
+        color: tuple, a: Tuple[float, float], b: Tuple[float, float], c: Tuple[float, float]
+) -> Tuple[Surface, Tuple[int, int]]:
+    """Draw a triangle on a surface fitting its bounding box, returns the surface and where to blit it."""
+    points = (a, b, c)
+    left, top = math.floor(min(x for x, _ in points)), math.floor(min(y for _, y in points))
+    right, bottom = math.ceil(max(x for x, _ in points)), math.ceil(max(y for _, y in points))
+
     # Fill the triangle with alpha color in a new surface.
-    surf = Surface(constants.window.size)
+    surf = Surface((right - left + 1, bottom - top + 1))
     surf.set_colorkey((0, 0, 0))
     if len(color) == 4:
         surf.set_alpha(color[3])
 
     # Draw the triangle and return the surface.
-    pygame.draw.polygon(surf, color, [a, b, c])
-    return surf
+    pygame.draw.polygon(surf, color, [(x - left, y - top) for x, y in points])
+    return surf, (left, top)
+
+
+@lru_cache(maxsize=None)
+def get_font(path: Path, size: int) -> Font:
+    """Gets a font, loading it from its file on the first use."""
+    return Font(path, size)
+
+
+class TextCache:
+    """Keeps the most recently rendered texts, so unchanged labels are not rasterised every frame."""
+
+    def __init__(self, size: int = constants.fonts.text_cache_size):
+        self.size = size
+        self.surfaces: OrderedDict = OrderedDict()
+
+        # Statistics.
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text: str, font: Path, size: int, color: tuple, antialias: bool = True) -> Surface:
+        """Gets the rendered text, rendering it if it is not cached. The surface is shared, do not draw on it."""
+        key = (text, font, size, color, antialias)
+        if key in self.surfaces:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return self.surfaces[key]
+
+        self.misses += 1
+        surface = self.surfaces[key] = get_font(font, size).render(text, antialias, color)
+        if len(self.surfaces) > self.size:
+            self.surfaces.popitem(last=False)
+
+        return surface
+
+    def get_stats(self) -> dict:
+        """Gets the number of cached texts, hits, misses and fonts loaded."""
+        return {
+            "size": len(self.surfaces),
+            "hits": self.hits,
+            "misses": self.misses,
+            "fonts": get_font.cache_info().currsize
+        }
+
+
+text_cache = TextCache()
+
+
+class DirtyRegion:
+    """A region of the window that is only redrawn when what is drawn in it changes."""
+
+    def __init__(self, rect: Rect):
+        self.rect = Rect(rect)
+        self.key: Hashable = None
+
+    def check(self, key: Hashable) -> List[Rect]:
+        """Gets the region if the key changed since the last check, the mouse counts when it is in the region."""
+        if self.rect.collidepoint(state.mouse_pos):
+            key = (key, state.mouse_pos, state.holding_mouse)
+
+        if key == self.key:
+            return []
+
+        self.key = key
+        return [self.rect]
+
+
+class Animation:
+    """An animation whose frames are decoded once, on the first use, into a single converted surface."""
+
+    def __init__(self, paths: Sequence[Path], frame_duration: float):
+        self.paths = paths
+        self.frame_duration = frame_duration
+
+        # The frames side by side and the area of each one.
+        self.atlas: Optional[Surface] = None
+        self.frames: List[Rect] = []
+
+    def load(self) -> None:
+        """Decodes the frames into the atlas, in the display's pixel format when there is one."""
+        images = [pygame.image.load(path) for path in self.paths]
+        self.atlas = Surface(
+            (sum(image.get_width() for image in images), max(image.get_height() for image in images)), pygame.SRCALPHA
+        )
+
+        x = 0
+        for image in images:
+            self.frames.append(self.atlas.blit(image, (x, 0)))
+            x += image.get_width()
+
+        if pygame.display.get_surface():
+            self.atlas = self.atlas.convert_alpha()
+
+    def get_frame(self, seconds: float) -> int:
+        """Gets the frame to show at the given time."""
+        return int(seconds / self.frame_duration) % len(self.paths)
+
+    def get_rect(self, frame: int, center: Tuple[int, int]) -> Rect:
+        """Gets where a frame is drawn around the given center."""
+        if self.atlas is None:
+            self.load()
+
+        rect = self.frames[frame].copy()
+        rect.center = center
+        return rect
+
+    def render(self, surface: Surface, frame: int, center: Tuple[int, int]) -> None:
+        """Renders a frame around the given center."""
+        surface.blit(self.atlas, self.get_rect(frame, center), self.frames[frame])
 
 
 def prompt_file() -> Path:
     """Create a TK file dialog."""
+    # Tkinter is only needed with a display, headless installs may not have it.
+    import tkinter as tk
+    from tkinter.filedialog import askopenfilename
+
     root = tk.Tk()
     root.withdraw()
 
@@ -1,11 +1,14 @@
 import logging
-from typing import Tuple
+from typing import List, Optional, Tuple
 
 import pygame
+from pygame import Rect
 
+from app import show
 from app.components import Arduino, AudioVisualizer, Servo
 from app.core import constants
 from app.state import state
+from app.utils.ui import Animation
 
 log = logging.getLogger(__name__)
 
@@ -25,6 +28,15 @@ class Window:
         self.running = True
         self.screen = None
 
+        # The whole window is drawn on the first frame and after it was hidden.
+        self.redraw = True
+
+        # The loading animation is shown over the visualizer while a file loads.
+        self.loading_animation = Animation(
+            constants.visualizer.loading_animation, constants.visualizer.loading_animation_speed
+        )
+        self.loading_frame: Optional[int] = None
+
         # Components initiation.
         self.audio_visualizer = None
         self.servo = None
@@ -66,9 +78,16 @@ class Window:
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    if self.audio_visualizer.live:
+                        self.audio_visualizer.toggle_live()
+                    self.audio_visualizer.stop()
+                    self.arduino.close()
                     self.close()
                     self.running = False
 
+                if event.type in (pygame.VIDEOEXPOSE, pygame.VIDEORESIZE, pygame.WINDOWEXPOSED):
+                    self.redraw = True
+
                 # Get angle from pivot to mouse position using atan2.
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     state.holding_mouse = True
@@ -88,55 +107,101 @@ class Window:
 
                 if event.type == pygame.KEYDOWN:
                     if event.key in (pygame.K_SPACE, pygame.K_RETURN, pygame.K_KP_ENTER):
-                        if not self.audio_visualizer.audio_file.loading:
-                            if self.audio_visualizer.audio_file.started:
-                                self.audio_visualizer.audio_file.paused = not self.audio_visualizer.audio_file.paused
-
-                                if self.audio_visualizer.audio_file.paused:
-                                    # Pause the audio file.
-                                    log.info("Pausing audio file")
-                                    pygame.mixer.music.pause()
-                                else:
-                                    # Pause the audio file.
-                                    log.info("Resuming audio file")
-                                    pygame.mixer.music.unpause()
-                            else:
-                                # Play the audio file.
-                                log.info("Playing audio file")
-                                pygame.mixer.music.play(0)
-                                self.audio_visualizer.audio_file.started = True
+                        self.audio_visualizer.toggle_playback()
+
+                    elif event.key == pygame.K_e:
+                        audio_file = self.audio_visualizer.audio_file
+                        if audio_file.cache_dir and not audio_file.loading:
+                            # Export the servo timeline next to the cache.
+                            audio_file.timeline.update(audio_file.spectrogram, audio_file.analysed_frames)
+                            audio_file.timeline.export(
+                                f"{audio_file.cache_dir}/timeline.csv", audio_file.time_index_ratio
+                            )
+
+                    elif event.key == pygame.K_d:
+                        audio_file = self.audio_visualizer.audio_file
+                        if audio_file.cache_dir and not audio_file.loading:
+                            # Compile the show for the board to play on its own.
+                            audio_file.timeline.update(audio_file.spectrogram, audio_file.analysed_frames)
+                            try:
+                                show.export(
+                                    f"{audio_file.cache_dir}/show.h",
+                                    show.compile_show(audio_file.timeline, audio_file.time_index_ratio)
+                                )
+                            except ValueError as e:
+                                log.error(f"Could not compile the show: {e}")
+
+                    elif event.key == pygame.K_t:
+                        # Show the serial link telemetry.
+                        self.arduino.show_telemetry = not self.arduino.show_telemetry
+
+                    elif event.key == pygame.K_l:
+                        # Follow the microphone instead of a file, or stop following it.
+                        self.audio_visualizer.toggle_live()
 
                     elif event.key in (pygame.K_ESCAPE, pygame.K_END, pygame.K_x, pygame.K_q):
-                        if not self.audio_visualizer.audio_file.loading:
-                            self.audio_visualizer.stop()
+                        # Stopping also cancels the analysis in flight.
+                        self.audio_visualizer.stop()
 
             # Update game state attributes.
             state.mouse_pos = pygame.mouse.get_pos()
 
-            # Fill the background with white and surfaces.
-            self.screen.fill(constants.colors.white)
-
-            # Draw the servo.
+            # Update the components.
             self.servo.update(state.angle)
-            self.servo.render(self.screen)
-
-            # Draw the audio visualizer.
             self.audio_visualizer.update(delta_time)
-            self.audio_visualizer.render(self.screen)
-
-            # Render animations if any.
-            if state.loading:
-                img = pygame.image.load(state.loading_frame)
-                width, height = img.get_width(), img.get_height()
-
-                # Render the loading animation on the surface.
-                self.screen.blit(img, (
-                    (self.audio_visualizer.width + self.audio_visualizer.pos[0] * 2) // 2 - width // 2,
-                    (self.audio_visualizer.height + self.audio_visualizer.pos[1] * 2) // 2 - height // 2
-                ))
 
-            # Update the screen.
+            # Find the regions that changed.
+            dirty = [*self.servo.get_dirty(), *self.audio_visualizer.get_dirty(), *self.arduino.get_dirty()]
+
+            # The frame of the loading animation follows the time, there is nothing to advance it.
+            audio_file = self.audio_visualizer.audio_file
+            loading = audio_file.file_path and audio_file.loading and not audio_file.cancelled
+            loading_frame = self.loading_animation.get_frame(t / 1000) if loading else None
+            if loading_frame != self.loading_frame:
+                dirty += [
+                    self.loading_animation.get_rect(frame, self.audio_visualizer.rect.center)
+                    for frame in (self.loading_frame, loading_frame) if frame is not None
+                ]
+                self.loading_frame = loading_frame
+
+            self.render(dirty)
+
+    def render(self, dirty: List[Rect]) -> None:
+        """Redraws the regions that changed, or the whole window when there are too many of them."""
+        area = sum(rect.width * rect.height for rect in dirty)
+        if (
+                self.redraw or len(dirty) > constants.window.dirty_rect_limit
+                or area > self.width * self.height * constants.window.dirty_area_limit
+        ):
+            self.redraw, dirty = False, [self.screen.get_rect()]
+        elif not dirty:
+            return
+
+        # Everything is drawn in layers, clipped to the regions so nothing else is touched.
+        self.screen.set_clip(dirty[0].unionall(dirty[1:]))
+
+        # Fill the background with white and surfaces.
+        self.screen.fill(constants.colors.white)
+
+        # Draw the servo.
+        self.servo.render(self.screen)
+
+        # Draw the audio visualizer.
+        self.audio_visualizer.render(self.screen)
+
+        # Draw the serial link telemetry.
+        self.arduino.render(self.screen)
+
+        # Render the loading animation on the surface.
+        if self.loading_frame is not None:
+            self.loading_animation.render(self.screen, self.loading_frame, self.audio_visualizer.rect.center)
+
+        # Update the regions of the screen.
+        self.screen.set_clip(None)
+        if dirty[0] == self.screen.get_rect():
             pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
 
     @staticmethod
     def close() -> None:
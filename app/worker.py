@@ -0,0 +1,131 @@
+import logging
+import multiprocessing
+import queue
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+import numpy as np
+
+from app.cache import save_spectrogram
+from app.core import constants
+from app.utils import analysis
+
+log = logging.getLogger(__name__)
+
+# Jobs fork from a server that already imported the analysis modules, where the platform allows it.
+if "forkserver" in multiprocessing.get_all_start_methods():
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["app.worker"])
+else:
+    context = multiprocessing.get_context("spawn")
+
+
+def run(
+        file_path: str, cache_dir: str, messages: multiprocessing.Queue, replies: multiprocessing.Queue,
+        progress: multiprocessing.Value
+) -> None:
+    """Analyses an audio file into the shared memory sent by the app, then caches it."""
+    try:
+        time_series, sample_rate = analysis.load(file_path)
+        frames = analysis.frame_count(len(time_series))
+        messages.put(("frames", frames, analysis.get_ratios(frames, sample_rate)))
+
+        # The app owns the shared memory, so it outlives this process.
+        shm = SharedMemory(replies.get())
+        spectrogram = np.ndarray((frames, len(analysis.bar_frequencies())), dtype=np.int8, buffer=shm.buf)
+
+        for start, stop, block in analysis.blocks(time_series, sample_rate):
+            spectrogram[start:stop] = block
+            progress.value = stop
+
+        save_spectrogram(cache_dir, spectrogram, analysis.get_ratios(frames, sample_rate))
+        del spectrogram
+        shm.close()
+
+        messages.put(("done",))
+    except Exception as e:
+        messages.put(("error", repr(e)))
+
+
+class AnalysisJob:
+    """Analyses an audio file in a worker process, streaming its spectrogram back through shared memory."""
+
+    def __init__(self, file_path: str, cache_dir: str):
+        self.file_path = file_path
+        self.messages, self.replies = context.Queue(), context.Queue()
+        self.progress = context.Value("q", 0, lock=False)
+
+        self.process = context.Process(
+            target=run, args=(file_path, cache_dir, self.messages, self.replies, self.progress), daemon=True
+        )
+
+        # Set once the worker decoded the file.
+        self.shm: Optional[SharedMemory] = None
+        self.spectrogram: Optional[np.ndarray] = None
+        self.ratios: dict = {}
+
+        self.done = False
+        self.error = ""
+
+    @property
+    def analysed_frames(self) -> int:
+        """Gets the number of frames written by the worker."""
+        return self.progress.value if self.spectrogram is not None else 0
+
+    def start(self) -> None:
+        """Starts the worker process."""
+        self.process.start()
+
+    def poll(self, timeout: float = 0.05) -> None:
+        """Handles a message from the worker, waiting up to the timeout for one."""
+        try:
+            message = self.messages.get(timeout=timeout)
+        except queue.Empty:
+            if self.process.is_alive() or self.done:
+                return
+
+            # The worker may have sent its last messages just before exiting.
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                self.error = self.error or f"Worker exited with code {self.process.exitcode}"
+                return
+
+        if message[0] == "frames":
+            _, frames, self.ratios = message
+            shape = (frames, len(analysis.bar_frequencies()))
+
+            # Share a spectrogram of silence for the worker to fill.
+            self.shm = SharedMemory(create=True, size=max(int(np.prod(shape)), 1))
+            self.spectrogram = np.ndarray(shape, dtype=np.int8, buffer=self.shm.buf)
+            self.spectrogram.fill(constants.visualizer.default_db)
+            self.replies.put(self.shm.name)
+
+        elif message[0] == "done":
+            self.done = True
+
+        elif message[0] == "error":
+            self.error = message[1]
+
+    def cancel(self) -> None:
+        """Stops the worker if it is running and releases the shared memory."""
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+            log.info(f"Cancelled analysis of {self.file_path}")
+
+        self.close()
+
+    def close(self) -> None:
+        """Releases the shared memory, the spectrogram must not be used afterwards."""
+        if self.shm:
+            self.spectrogram = None
+            self.shm.unlink()
+
+            # Views of the spectrogram still in use keep the memory mapped until they are collected.
+            try:
+                self.shm.close()
+            except BufferError:
+                pass
+
+            self.shm = None
@@ -1,20 +1,207 @@
 #include <Servo.h>
-Servo myServo;
+#include <avr/pgmspace.h>
 
-const int servoPin = 8;
+// A show compiled by the app plays from flash when show.h is next to the sketch, or from the EEPROM when
+// SHOW_IN_EEPROM is defined and show.bin was written to it.
+#if defined(SHOW_IN_EEPROM)
+#include <EEPROM.h>
+#elif __has_include("show.h")
+#include "show.h"
+#define SHOW_IN_FLASH
+#endif
+
+// Servo channels of this board, channel 0 is the first pin.
+const int servoPins[] = {8, 9, 10, 11};
+const byte SERVO_COUNT = sizeof(servoPins) / sizeof(servoPins[0]);
+Servo servos[SERVO_COUNT];
+
+// Every frame is the sync byte, a channel, a value and a checksum of the channel and value.
+const byte SYNC = 0xA5;
+const byte CHANNEL_PLAY = 0xFA;
+const byte CHANNEL_ERRORS = 0xFB;
+const byte CHANNEL_PING = 0xFC;
+const byte CHANNEL_READY = 0xFD;
+const byte CHANNEL_BAUD = 0xFE;
+
+// Baud rates the host may ask for by index, the same table as the app's constants.
+const long BAUD_RATES[] = {9600, 19200, 38400, 57600, 115200, 250000};
+const byte BAUD_RATE_COUNT = sizeof(BAUD_RATES) / sizeof(BAUD_RATES[0]);
+
+// Bytes of the current frame read so far.
+byte parserState = 0;
+byte channel = 0;
+byte value = 0;
+
+// Frames rejected by their checksum, reported to the host with every ping.
+byte errors = 0;
+
+// Pulling the start pin low plays the show, as does a play frame from the host.
+const int startPin = 2;
+
+// Show codes below SHOW_DELTA hold the angle, the others set it for one step.
+const byte SHOW_DELTA = 0x80;
+const byte SHOW_ABSOLUTE = 0xC0;
+
+bool playing = false;
+unsigned long showStart = 0;
+unsigned int showStep = 0;
+unsigned int showSteps = 0;
+byte showRate = 0;
+byte showChannels = 0;
+
+// Decoder state of every channel of the show.
+byte showServo[SERVO_COUNT];
+unsigned int showPosition[SERVO_COUNT];
+byte showAngle[SERVO_COUNT];
+byte showHold[SERVO_COUNT];
+
+byte checksum(byte channel, byte value) {
+  return ~(channel + value);
+}
+
+void sendFrame(byte channel, byte value) {
+  byte frame[] = {SYNC, channel, value, checksum(channel, value)};
+  Serial.write(frame, sizeof(frame));
+}
+
+byte readShow(unsigned int index) {
+#if defined(SHOW_IN_EEPROM)
+  return EEPROM.read(index);
+#elif defined(SHOW_IN_FLASH)
+  return pgm_read_byte(&SHOW[index]);
+#else
+  return 0;
+#endif
+}
+
+void startShow() {
+  // The header is the magic "AT", the format version, the rate, the channel count and the step count.
+  if (readShow(0) != 'A' || readShow(1) != 'T' || readShow(2) != 1) {
+    return;
+  }
+
+  showRate = readShow(3);
+  showChannels = min(readShow(4), SERVO_COUNT);
+  showSteps = readShow(5) | (readShow(6) << 8);
+
+  // Every channel has its servo and the offset of its stream.
+  for (byte i = 0; i < showChannels; i++) {
+    showServo[i] = readShow(7 + i * 3);
+    showPosition[i] = readShow(8 + i * 3) | (readShow(9 + i * 3) << 8);
+    showHold[i] = 0;
+  }
+
+  showStep = 0;
+  showStart = millis();
+  playing = true;
+}
+
+void stepShow() {
+  for (byte i = 0; i < showChannels; i++) {
+    if (showHold[i] > 0) {
+      showHold[i]--;
+    } else {
+      byte code = readShow(showPosition[i]++);
+      if (code < SHOW_DELTA) {
+        showHold[i] = code;
+      } else if (code < SHOW_ABSOLUTE) {
+        showAngle[i] += code - SHOW_DELTA - 32;
+      } else {
+        showAngle[i] = readShow(showPosition[i]++);
+      }
+    }
+
+    if (showServo[i] < SERVO_COUNT) {
+      servos[showServo[i]].write(showAngle[i]);
+    }
+  }
+}
+
+void updateShow() {
+  if (!playing) {
+    return;
+  }
+
+  // Catch up with the steps that are due, the show keeps its own time.
+  unsigned long due = (millis() - showStart) * showRate / 1000 + 1;
+  while (showStep < due && showStep < showSteps) {
+    stepShow();
+    showStep++;
+  }
+
+  if (showStep >= showSteps) {
+    playing = false;
+  }
+}
+
+void handleFrame(byte channel, byte value) {
+  if (channel < SERVO_COUNT) {
+    servos[channel].write(value);
+  } else if (channel == CHANNEL_PLAY) {
+    if (value) {
+      startShow();
+    } else {
+      playing = false;
+    }
+  } else if (channel == CHANNEL_PING) {
+    sendFrame(CHANNEL_PING, value);
+    sendFrame(CHANNEL_ERRORS, errors);
+  } else if (channel == CHANNEL_READY) {
+    sendFrame(CHANNEL_READY, SERVO_COUNT);
+  } else if (channel == CHANNEL_BAUD && value < BAUD_RATE_COUNT) {
+    // Acknowledge at the current rate, then switch.
+    sendFrame(CHANNEL_BAUD, value);
+    Serial.flush();
+    Serial.end();
+    Serial.begin(BAUD_RATES[value]);
+  }
+}
 
 void setup() {
-  myServo.attach(servoPin);
-  Serial.begin(9600);
+  for (byte i = 0; i < SERVO_COUNT; i++) {
+    servos[i].attach(servoPins[i]);
+    servos[i].write(90);
+  }
+
+  pinMode(startPin, INPUT_PULLUP);
 
-  myServo.write(90);
+  // Tell the host the sketch is running, it waits for this instead of a fixed delay after the reset.
+  Serial.begin(BAUD_RATES[0]);
+  sendFrame(CHANNEL_READY, SERVO_COUNT);
 }
 
 void loop() {
-  String data = Serial.readStringUntil(',');
+  if (!playing && digitalRead(startPin) == LOW) {
+    startShow();
+  }
+  updateShow();
+
+  // Only read the bytes that already arrived, the loop never waits for the rest of a frame.
+  while (Serial.available() > 0) {
+    byte data = Serial.read();
 
-  if (data == "servo") {
-    int rotation = Serial.readStringUntil('\n').toInt();
-    myServo.write(rotation);
+    switch (parserState) {
+      case 0:
+        if (data == SYNC) {
+          parserState = 1;
+        }
+        break;
+      case 1:
+        channel = data;
+        parserState = 2;
+        break;
+      case 2:
+        value = data;
+        parserState = 3;
+        break;
+      default:
+        parserState = 0;
+        if (data == checksum(channel, value)) {
+          handleFrame(channel, value);
+        } else {
+          errors++;
+        }
+        break;
+    }
   }
 }
@@ -0,0 +1,116 @@
+import gzip
+import hashlib
+import json
+import pickle
+
+import numpy as np
+
+from app import cache
+from app.cache import load_spectrogram, save_spectrogram
+from app.utils import analysis
+
+
+def test_spectrogram_round_trip(tmp_path):
+    """A saved spectrogram loads back memory mapped with its ratios."""
+    spectrogram = np.random.default_rng(0).integers(-80, 0, (500, 80), dtype=np.int8)
+    ratios = {"time_index_ratio": 43.0, "frequencies_index_ratio": 0.01}
+
+    save_spectrogram(str(tmp_path), spectrogram, ratios)
+    loaded, loaded_ratios = load_spectrogram(str(tmp_path))
+
+    assert isinstance(loaded, np.memmap)
+    assert np.array_equal(loaded, spectrogram)
+    assert loaded_ratios == ratios
+
+
+def test_legacy_cache_is_migrated(tmp_path):
+    """A gzip and pickle cache of full STFT bins is converted to bands and removed."""
+    sample_rate, n_fft = 22050, 8192
+    bins = n_fft // 2 + 1
+
+    # A single tone at 0 dB in the 1000 Hz band, everything else at the -80 dB floor.
+    spectrogram = np.full((bins, 10), -80, dtype=np.float32)
+    spectrogram[round(1000 * n_fft / sample_rate)] = 0
+
+    with gzip.open(tmp_path / "spectrogram.xz", "wb") as f:
+        pickle.dump(spectrogram, f)
+    with open(tmp_path / "ratios.json", "w") as f:
+        json.dump({"time_index_ratio": 43.0, "frequencies_index_ratio": bins / (sample_rate / 2)}, f)
+
+    loaded, ratios = load_spectrogram(str(tmp_path))
+
+    assert loaded.shape == (10, len(analysis.bar_frequencies()))
+    assert (loaded[:, 9] == 0).all() and (np.delete(loaded, 9, axis=1) == -80).all()
+    assert not (tmp_path / "spectrogram.xz").exists() and not (tmp_path / "ratios.json").exists()
+
+
+def test_unchanged_file_is_not_hashed_again(tmp_path, monkeypatch):
+    """The index answers for files whose size, mtime and inode did not change."""
+    audio = tmp_path / "song.wav"
+    audio.write_bytes(b"\x00" * 4096)
+    manager = cache.CacheManager(str(tmp_path / "cache"))
+    key = manager.get_key(str(audio))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("File was hashed again")
+
+    monkeypatch.setattr(cache, "hash_file", fail)
+    assert manager.get_key(str(audio)) == key
+
+    monkeypatch.undo()
+    audio.write_bytes(b"\x01" * 4096)
+    assert manager.get_key(str(audio)) != key
+
+
+def test_md5_cache_is_renamed(tmp_path):
+    """A cache directory named after the md5 of the file is reused under the new key."""
+    audio = tmp_path / "song.wav"
+    audio.write_bytes(b"song")
+    (tmp_path / "cache" / hashlib.md5(b"song").hexdigest()).mkdir(parents=True)
+
+    key = cache.CacheManager(str(tmp_path / "cache")).get_key(str(audio))
+
+    assert (tmp_path / "cache" / key).is_dir()
+    assert not (tmp_path / "cache" / hashlib.md5(b"song").hexdigest()).exists()
+
+
+def test_new_caches_are_not_taken_for_md5_caches(tmp_path, monkeypatch):
+    """Only the caches found when the index was created are looked up by md5, not the ones keyed since."""
+    manager = cache.CacheManager(str(tmp_path / "cache"))
+    for name in ("a", "b"):
+        audio = tmp_path / f"{name}.wav"
+        audio.write_bytes(name.encode())
+        (tmp_path / "cache" / manager.get_key(str(audio))).mkdir(parents=True)
+
+    hashed = []
+    hash_file = cache.hash_file
+    monkeypatch.setattr(cache, "hash_file", lambda *args: hashed.append(args) or hash_file(*args))
+    for content in (b"changed", b"changed again"):
+        (tmp_path / "a.wav").write_bytes(content)
+        (tmp_path / "cache" / manager.get_key(str(tmp_path / "a.wav"))).mkdir()
+
+    assert hashed == [(str(tmp_path / "a.wav"), False)] * 2
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    """Entries over the budget are evicted oldest first, keeping protected entries and profiles."""
+    manager = cache.CacheManager(str(tmp_path / "cache"), size_limit=2500)
+
+    for name in ("a", "b", "c"):
+        audio = tmp_path / f"{name}.wav"
+        audio.write_bytes(b"\x00" * 100)
+
+        (tmp_path / "cache" / name).mkdir(parents=True)
+        (tmp_path / "cache" / name / "spectrogram.npy").write_bytes(b"\x00" * 1000)
+        (tmp_path / "cache" / name / "profile.json").write_text("{}")
+
+        manager.add(name, str(audio), protected={"a"})
+
+    entries = manager.load()["entries"]
+    assert set(entries) == {"a", "c"}
+    assert not (tmp_path / "cache" / "b" / "spectrogram.npy").exists()
+    assert (tmp_path / "cache" / "b" / "profile.json").exists()
+    assert not (tmp_path / "cache" / "recent" / "b.wav").exists()
+
+    # Recent files are linked rather than copied.
+    assert (tmp_path / "cache" / "recent" / "c.wav").stat().st_ino == (tmp_path / "c.wav").stat().st_ino
@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+import soundfile
+
+from app import cli
+from app.cache import cache_manager, load_spectrogram
+from app.core import settings
+
+
+def test_analyze_skips_cached_files_and_reports_failures(tmp_path, monkeypatch):
+    """New files are analysed into the cache, cached ones are skipped and a failed file sets the exit code."""
+    for target, name in ((settings, "cache_path"), (cache_manager, "cache_path")):
+        monkeypatch.setattr(target, name, str(tmp_path / "cache"))
+
+    library = tmp_path / "library"
+    library.mkdir()
+    t = np.arange(22050) / 22050
+    soundfile.write(str(library / "a.wav"), 0.5 * np.sin(2 * np.pi * 440 * t), 22050)
+    (library / "broken.wav").write_bytes(b"not audio")
+
+    assert cli.analyze([str(library)], jobs=1) == 1
+
+    key = cache_manager.get_key(str(library / "a.wav"))
+    spectrogram, _ = load_spectrogram(f"{tmp_path}/cache/{key}")
+    assert len(spectrogram)
+
+    # Library files are indexed without filling the recent directory.
+    assert cache_manager.load()["entries"][key]["recent"] == ""
+    assert not os.path.exists(tmp_path / "cache" / "recent")
+
+    # Cached files are not analysed again.
+    os.remove(library / "broken.wav")
+    monkeypatch.setattr(cli, "analyse_file", None)
+    assert cli.analyze([str(library)], jobs=1) == 0
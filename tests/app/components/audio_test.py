@@ -0,0 +1,144 @@
+import time
+from typing import Optional
+
+import numpy as np
+import pygame
+import pytest
+import soundfile
+
+from app.cache import cache_manager
+from app.components import audio
+from app.components.audio import AudioBars, AudioFile, AudioVisualizer
+from app.core import constants, settings
+from app.live import GeneratorSource
+from app.state import state
+
+
+class BrokenSource(GeneratorSource):
+    """A source whose device fails to start, like a microphone rejecting the sample rate."""
+
+    def start(self) -> None:
+        raise OSError("Invalid sample rate")
+
+    def read(self) -> Optional[np.ndarray]:
+        return None
+
+
+@pytest.fixture
+def visualizer(monkeypatch):
+    """A visualizer with the dummy audio driver."""
+    monkeypatch.setenv("SDL_AUDIODRIVER", "dummy")
+    pygame.mixer.init()
+    yield AudioVisualizer(constants.visualizer.pos, constants.visualizer.size, None)
+    pygame.mixer.quit()
+
+
+def test_live_input_that_fails_to_start_is_not_followed(visualizer):
+    """A device error when starting the live input is logged instead of leaving the window loop."""
+    visualizer.toggle_live(BrokenSource([]))
+    assert visualizer.live is None
+
+    visualizer.toggle_live(GeneratorSource([]))
+    assert visualizer.live is not None
+
+
+def test_click_released_outside_the_visualizer_is_not_latched(visualizer, monkeypatch):
+    """A click released outside every redrawn region still lets the next click toggle the pause."""
+    visualizer.audio_file.file_path, visualizer.audio_file.loading = "track.wav", False
+    visualizer.audio_file.started = True
+
+    inside, outside = visualizer.rect.center, (constants.window.size[0] - 1, constants.window.size[1] - 1)
+    for mouse_pos, holding_mouse in ((inside, True), (outside, True), (outside, False), (inside, True)):
+        monkeypatch.setattr(state, "mouse_pos", mouse_pos)
+        monkeypatch.setattr(state, "holding_mouse", holding_mouse)
+        visualizer.handle_input()
+
+        if mouse_pos == inside:
+            assert visualizer.clicked
+
+    # Paused by the first click and resumed by the second.
+    assert not visualizer.audio_file.paused
+
+
+def test_file_that_fails_to_analyse_is_not_played(visualizer, tmp_path, monkeypatch):
+    """A file the worker cannot decode is never handed to the mixer and the visualizer asks for another file."""
+    for target, name in ((settings, "cache_path"), (cache_manager, "cache_path")):
+        monkeypatch.setattr(target, name, str(tmp_path / "cache"))
+    monkeypatch.setattr(state, "cache_dir", str(tmp_path / "cache" / "default"))
+    monkeypatch.setattr(audio, "prompt_file", lambda: "")
+
+    track = tmp_path / "broken.wav"
+    track.write_bytes(b"not a wave file")
+    visualizer.load_file(str(track))
+    audio_file = visualizer.audio_file
+
+    deadline = time.monotonic() + 60
+    while not audio_file.failed and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    # Enter and a click on the visualizer, which would raise if the mixer had nothing loaded.
+    assert audio_file.failed
+    visualizer.toggle_playback()
+    assert not audio_file.started
+
+    monkeypatch.setattr(state, "mouse_pos", visualizer.rect.center)
+    monkeypatch.setattr(state, "holding_mouse", True)
+    visualizer.handle_input()
+
+    assert not audio_file.started
+    assert visualizer.audio_file is not audio_file and not visualizer.audio_file.file_path
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_playback_waits_for_the_lead(streaming, tmp_path, monkeypatch):
+    """Playback unlocks once the lead is analysed, or once every frame is without streaming."""
+    for target, name in ((settings, "cache_path"), (cache_manager, "cache_path")):
+        monkeypatch.setattr(target, name, str(tmp_path / "cache"))
+    monkeypatch.setattr(state, "cache_dir", str(tmp_path / "cache" / "default"))
+    monkeypatch.setattr(constants.analysis, "streaming", streaming)
+    monkeypatch.setattr(constants.analysis, "lead_time", 1)
+
+    track = str(tmp_path / "track.wav")
+    noise = np.random.default_rng(0).uniform(-0.5, 0.5, 22050 * 30).astype(np.float32)
+    soundfile.write(track, noise, 22050)
+
+    # The frames analysed when the file is handed to the mixer.
+    audio_file = AudioFile(track)
+    unlocked = []
+    monkeypatch.setattr(pygame.mixer.music, "load", lambda _: unlocked.append(audio_file.analysed_frames))
+    monkeypatch.setattr(audio_file, "cache", lambda: None)
+    audio_file.load()
+
+    frames = len(audio_file.spectrogram)
+    assert len(unlocked) == 1 and unlocked[0] >= audio_file.time_index_ratio
+    assert (unlocked[0] < frames) if streaming else (unlocked[0] == frames)
+
+
+def test_bars_follow_the_per_bar_formula():
+    """The bars move a tenth of the way to their target height per 10 ms and stay within their limits."""
+    frequencies = np.arange(100, 600, 100)
+    bars = AudioBars(0, 0, frequencies, (0, 0, 0), min_height=10, max_height=300)
+    decibels = np.array([-80, -60, -30, -5, 0], dtype=np.int8)
+
+    expected = np.full(len(frequencies), 10.0)
+    for dt in (1 / 60, 1 / 30, 0.2):
+        bars.update(dt, decibels)
+        for i, decibel in enumerate(decibels):
+            # The formula of the former single bar class.
+            desired_height = decibel * bars.decibel_height_ratio + bars.max_height
+            expected[i] += (desired_height - expected[i]) / 0.1 * dt
+            expected[i] = min(max(expected[i], bars.min_height), bars.max_height)
+
+        np.testing.assert_allclose(bars.heights, expected, rtol=1e-5)
+
+
+def test_frame_is_silent_outside_the_analysed_frames():
+    """Times before the start or past the analysed frames get the silent frame."""
+    audio_file = AudioFile("track.wav")
+    audio_file.time_index_ratio = 10
+    audio_file.spectrogram = np.arange(4 * len(audio_file.frequencies), dtype=np.int8).reshape(4, -1)
+    audio_file.analysed_frames = 2
+
+    np.testing.assert_array_equal(audio_file.get_frame(0.15), audio_file.spectrogram[1])
+    for target_time in (-0.1, 0.25, 10):
+        np.testing.assert_array_equal(audio_file.get_frame(target_time), audio_file.silence)
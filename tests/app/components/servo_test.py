@@ -0,0 +1,40 @@
+from app.components.servo import Handle
+from app.core import constants
+from app.utils.ui import draw_triangle
+
+
+def test_triangle_fits_its_bounding_box():
+    """Triangles are drawn on a surface the size of their bounding box, not of the window."""
+    surf, pos = draw_triangle((255, 0, 0, 40), (10.5, 20), (10.5, 36), (60, 25))
+
+    assert pos == (10, 20)
+    assert surf.get_size() == (51, 17)
+
+
+def test_overlays_are_drawn_once_per_range():
+    """The overlays of a rotation range are reused, and the least recently used ranges are dropped."""
+    handle = Handle((100, 200))
+
+    overlays = handle.get_overlays((30, 150))
+    assert handle.get_overlays((30, 150)) is overlays
+
+    for low in range(constants.handle.overlay_cache_size + 1):
+        handle.get_overlays((low, 150))
+
+    assert len(handle.overlays) == constants.handle.overlay_cache_size
+    assert (0, 150) not in handle.overlays
+
+
+def test_rotations_are_reused():
+    """Every angle is rotated once, and its rect keeps the pivot in place."""
+    handle = Handle((100, 200))
+
+    handle.update(30)
+    image, rect = handle.rotated_image, handle.rect
+    handle.update(120)
+    handle.update(30)
+
+    assert handle.rotated_image is image
+    assert handle.rect == rect
+    assert set(handle.rotations) == {30, 120}
+    assert handle.rotate(30)[1] == rect
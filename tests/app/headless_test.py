@@ -0,0 +1,52 @@
+import numpy as np
+import soundfile
+
+from app import headless
+from app.cache import cache_manager
+from app.core import settings
+from app.state import state
+
+# Every board created by a test.
+sent = []
+
+
+class FakeArduino:
+    """Records the rotations it is sent."""
+
+    def __init__(self, pos: tuple):
+        self.sent = []
+        self.closed = False
+        sent.append(self)
+
+    def get_latency(self) -> float:
+        return 0.0
+
+    def send(self, rotations: np.ndarray) -> None:
+        self.sent.append(rotations.copy())
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_play_drives_servos_without_a_display(tmp_path, monkeypatch):
+    """A file is analysed and played with the mixer alone, sending rotations until it ends."""
+    monkeypatch.setenv("SDL_AUDIODRIVER", "dummy")
+    for target, name in ((settings, "cache_path"), (cache_manager, "cache_path")):
+        monkeypatch.setattr(target, name, str(tmp_path / "cache"))
+    monkeypatch.setattr(state, "cache_dir", str(tmp_path / "cache" / "default"))
+    monkeypatch.setattr(headless, "Arduino", FakeArduino)
+
+    track = str(tmp_path / "track.wav")
+    t = np.arange(22050 * 2) / 22050
+    soundfile.write(track, (0.5 * np.sin(2 * np.pi * 440 * t) * (t < 1)).astype(np.float32), 22050)
+
+    assert headless.play(track, rate=100) == 0
+
+    arduino = sent[-1]
+    assert arduino.closed and len(arduino.sent) > 50
+    assert len({int(rotations[0]) for rotations in arduino.sent}) > 1
+
+
+def test_play_missing_file(tmp_path):
+    """A missing file fails without touching the mixer."""
+    assert headless.play(str(tmp_path / "missing.wav")) == 1
@@ -0,0 +1,247 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from serial import SerialException
+
+from app.components.arduino import Arduino
+from app.core import constants
+from app.link import Board, SerialLink, find_ports
+from app.state import state
+from app.utils import protocol
+from app.utils.arduino import rotation_table
+from app.utils.channels import Channel
+from app.utils.protocol import Parser
+
+
+class FakeSerial:
+    """Records writes, blocking each one until it is released."""
+
+    port = "fake"
+    in_waiting = 0
+
+    def __init__(self, fail: bool = False):
+        self.data = b""
+        self.fail = fail
+        self.release = threading.Event()
+
+    def write(self, data: bytes) -> int:
+        self.release.wait()
+        if self.fail:
+            raise SerialException("device disconnected")
+
+        self.data += data
+        return len(data)
+
+    def read(self, size: int) -> bytes:
+        time.sleep(0.01)
+        return b""
+
+    def close(self) -> None:
+        self.release.set()
+
+
+def wait_for(condition, timeout: float = 5) -> None:
+    """Waits until the condition is true."""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_mailbox_keeps_latest_value_while_port_is_stalled():
+    """Values put while a write is stalled never block and only the latest one is written next."""
+    fake = FakeSerial()
+    link = SerialLink(fake, control_rate=1000, ping_interval=None)
+    link.start()
+
+    link.put(0, 10)
+    wait_for(lambda: not link.mailbox)
+
+    start = time.perf_counter()
+    for angle in range(20, 120):
+        link.put(0, angle)
+    assert time.perf_counter() - start < 0.1
+
+    fake.release.set()
+    wait_for(lambda: link.writes == 2)
+    link.stop()
+
+    assert Parser().parse(fake.data) == [(0, 10), (0, 119)]
+    assert link.get_stats()["coalesced"] == 99
+
+
+def test_unchanged_values_are_skipped():
+    """A value the board already has is not written again within the resend interval."""
+    fake = FakeSerial()
+    fake.release.set()
+    link = SerialLink(fake, control_rate=1000, resend_interval=60, ping_interval=None)
+    link.start()
+
+    for _ in range(5):
+        link.put(0, 90)
+        wait_for(lambda: not link.mailbox)
+        time.sleep(0.005)
+
+    link.stop()
+    assert Parser().parse(fake.data) == [(0, 90)]
+    assert link.get_stats()["skipped"] == 4
+
+
+def test_write_error_stops_link():
+    """A failed write marks the link as dead instead of raising in the caller."""
+    fake = FakeSerial(fail=True)
+    fake.release.set()
+    link = SerialLink(fake)
+    link.start()
+
+    link.put(0, 90)
+    wait_for(lambda: not link.alive)
+    assert "device disconnected" in link.error
+
+
+class FakeBoard:
+    """A serial port to a board that announces itself after a delay, acknowledges baud requests and echoes pings."""
+
+    in_waiting = 0
+
+    def __init__(self, port: str, baud_rate: int, timeout: float, ready_after: float = 0.1, ready: bool = True):
+        self.port, self.baudrate, self.timeout = port, baud_rate, timeout
+        self.ready_at = time.monotonic() + ready_after if ready else float("inf")
+        self.replies = b""
+        self.closed = False
+
+    def read(self, size: int) -> bytes:
+        if time.monotonic() >= self.ready_at:
+            self.ready_at = float("inf")
+            self.replies += protocol.encode(protocol.CHANNEL_READY, 4)
+
+        if not self.replies:
+            time.sleep(self.timeout)
+
+        data, self.replies = self.replies[:size], self.replies[size:]
+        return data
+
+    def write(self, data: bytes) -> int:
+        for channel, value in Parser().parse(data):
+            if channel in (protocol.CHANNEL_BAUD, protocol.CHANNEL_PING):
+                self.replies += protocol.encode(channel, value)
+            if channel == protocol.CHANNEL_PING:
+                self.replies += protocol.encode(protocol.CHANNEL_ERRORS, 2)
+        return len(data)
+
+    def reset_input_buffer(self) -> None:
+        self.replies = b""
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_board_connects_once_ready(monkeypatch):
+    """A board is used as soon as it announces itself, then switched to the fast baud rate."""
+    monkeypatch.setattr("app.link.Serial", FakeBoard)
+
+    start = time.monotonic()
+    board = Board("/dev/ttyACM0")
+    elapsed = time.monotonic() - start
+    board.close()
+
+    assert elapsed < 0.5
+    assert board.servos == 4 and board.serial.baudrate == constants.arduino.fast_baud_rate
+
+
+def test_unknown_port_must_reply(monkeypatch):
+    """Ports of unknown USB devices that never announce a sketch are closed and rejected."""
+    ports = []
+
+    def open_port(*args, **kwargs) -> FakeBoard:
+        ports.append(FakeBoard(*args, ready=False, **kwargs))
+        return ports[-1]
+
+    monkeypatch.setattr("app.link.Serial", open_port)
+    monkeypatch.setattr(constants.arduino, "ready_timeout", 0.2)
+
+    with pytest.raises(SerialException):
+        Board("/dev/ttyUSB0", known=False)
+
+    assert ports[0].closed
+
+
+def test_find_ports_filters_by_vendor(monkeypatch):
+    """Known arduino vendors come first, ports without a USB vendor are skipped."""
+    monkeypatch.setattr("app.link.list_ports.comports", lambda: [
+        SimpleNamespace(device="/dev/ttyS0", vid=None),
+        SimpleNamespace(device="/dev/ttyUSB0", vid=0x067B),
+        SimpleNamespace(device="/dev/ttyACM1", vid=0x2341),
+        SimpleNamespace(device="/dev/ttyACM0", vid=0x1A86)
+    ])
+
+    assert find_ports() == (["/dev/ttyACM0", "/dev/ttyACM1"], ["/dev/ttyUSB0"])
+
+
+def test_board_telemetry(monkeypatch):
+    """Pings measure the round trip, and the board's checksum errors are reported."""
+    monkeypatch.setattr("app.link.Serial", FakeBoard)
+
+    # The first ping goes out with the first write.
+    board = Board("/dev/ttyACM0")
+    board.link.put(0, 90)
+    wait_for(lambda: board.link.replies and board.link.commands)
+    stats = board.link.get_stats()
+    board.close()
+
+    assert 0 < stats["round_trip"]["p50"] <= stats["round_trip"]["p99"]
+    assert stats["board_checksum_errors"] == 2 and stats["checksum_errors"] == 0
+    assert board.link.commands == 1
+
+
+def test_lost_boards_are_closed_off_the_render_thread(monkeypatch):
+    """Sending to a lost board returns at once, the stalled port is closed by the reconnect task."""
+    monkeypatch.setattr("app.components.arduino.find_ports", lambda: ([], []))
+    monkeypatch.setattr("app.components.arduino.list_ports.comports", lambda: [])
+    arduino = Arduino((0, 0))
+
+    release, closed = threading.Event(), threading.Event()
+
+    def close() -> None:
+        release.wait()
+        closed.set()
+
+    arduino.boards = [SimpleNamespace(port="fake", link=SimpleNamespace(alive=False), close=close)]
+    arduino.port = "fake"
+
+    start = time.perf_counter()
+    arduino.send(np.array([90]))
+    assert time.perf_counter() - start < 0.1
+    assert not arduino.boards and arduino.reconnects == 1
+
+    release.set()
+    assert closed.wait(5)
+    arduino.close()
+
+
+def test_boards_are_added_when_the_channels_need_them(monkeypatch):
+    """A profile driving a second board connects it next to the first one, which keeps its port."""
+    monkeypatch.setattr("app.components.arduino.find_ports", lambda: (["/dev/ttyACM0", "/dev/ttyACM1"], []))
+    monkeypatch.setattr("app.components.arduino.list_ports.comports", lambda: [])
+    monkeypatch.setattr("app.components.arduino.Board", lambda port, known: SimpleNamespace(
+        port=port, link=SimpleNamespace(alive=True, put=lambda servo, value: None), close=lambda: None
+    ))
+    monkeypatch.setattr(state, "channels", [])
+    monkeypatch.setattr(rotation_table, "channels", state.get_channels())
+
+    arduino = Arduino((0, 0))
+    wait_for(lambda: arduino.p is None)
+    first = arduino.boards[0]
+    assert arduino.ports == ["/dev/ttyACM0"]
+
+    monkeypatch.setattr(state, "channels", [Channel("second", board=1)])
+    monkeypatch.setattr(rotation_table, "channels", state.get_channels())
+    arduino.send(np.array([90, 90]))
+    wait_for(lambda: len(arduino.boards) == 2)
+    boards = arduino.boards
+    arduino.close()
+
+    assert arduino.ports == ["/dev/ttyACM0", "/dev/ttyACM1"]
+    assert boards[0] is first
@@ -0,0 +1,54 @@
+import numpy as np
+
+from app.core import constants
+from app.live import GeneratorSource, LiveAnalyzer
+from app.utils import analysis
+
+
+def make_blocks(samples: np.ndarray, block_size: int):
+    """Splits a signal into blocks of the given size."""
+    return [samples[i:i + block_size] for i in range(0, len(samples), block_size)]
+
+
+def test_live_frames_match_block_stft():
+    """Frames of blocks of any size match a STFT of the stream ending at every hop."""
+    n_fft, hop = 2048, 512
+    samples = np.random.default_rng(0).uniform(-0.5, 0.5, 22050).astype(np.float32)
+    live = LiveAnalyzer(GeneratorSource([]), n_fft=n_fft, hop_length=hop)
+
+    frames = np.concatenate([live.process(block) for block in make_blocks(samples, 700)])
+
+    # The ring buffer starts silent, as if the stream was preceded by zeros.
+    padded = np.concatenate([np.zeros(n_fft - hop, dtype=np.float32), samples])
+    frame_count = len(samples) // hop
+    matrix = analysis.band_matrix(22050, analysis.bar_frequencies(), n_fft)
+    expected = analysis.band_dbfs(analysis.stft_block(padded, 0, frame_count, n_fft, hop), matrix, n_fft)
+
+    assert frames.shape == expected.shape and live.frames == frame_count
+    assert np.abs(frames.astype(int) - expected).max() <= 1
+    assert np.array_equal(live.frame, frames[-1])
+
+
+def test_live_drops_backlog_and_measures_latency():
+    """Polling keeps only the newest blocks of a backlog and records the latency of each one."""
+    blocks = make_blocks(np.zeros(512 * 20, dtype=np.float32), 512)
+    live = LiveAnalyzer(GeneratorSource(blocks), max_backlog=8)
+
+    live.poll()
+    latency = live.get_latency()
+
+    assert live.frames == 8 and latency["dropped"] == 12
+    assert live.blocks == 8 and latency["budget"] == 512 / 22050
+    assert 0 < latency["mean"] <= latency["max"]
+
+
+def test_live_latency_keeps_recent_blocks(monkeypatch):
+    """Only the latency of the last blocks of the window is kept, however long the input runs."""
+    monkeypatch.setattr(constants.latency, "jitter_window", 4)
+    live = LiveAnalyzer(GeneratorSource([]))
+
+    for size in (512, 512, 256, 256, 256, 256):
+        live.process(np.zeros(size, dtype=np.float32))
+
+    assert live.blocks == 6 and len(live.latencies) == 4
+    assert live.get_latency()["budget"] == 256 / 22050
@@ -0,0 +1,50 @@
+import numpy as np
+
+from app import show
+from app.state import state
+from app.timeline import Timeline
+from app.utils.channels import Channel
+
+
+def make_timeline(seconds: float, frames_per_second: float = 22050 / 512) -> Timeline:
+    """Gets the timeline of a spectrogram that wanders like music."""
+    rng = np.random.default_rng(0)
+    frames = int(seconds * frames_per_second)
+    walk = np.cumsum(rng.normal(0, 2, (frames, 1)), axis=0) + rng.normal(0, 3, (frames, 80))
+    spectrogram = np.clip(walk - 50, -80, 0).astype(np.int8)
+
+    timeline = Timeline()
+    timeline.update(spectrogram, frames)
+    return timeline
+
+
+def test_player_reproduces_sampled_angles(monkeypatch):
+    """The reference player decodes every channel of the board to the angles the host would send."""
+    monkeypatch.setattr(state, "channels", [Channel("brow", 0, 2, (2000, 8100), (30, 150))])
+    ratio = 22050 / 512
+    timeline = make_timeline(30, ratio)
+
+    data = show.compile_show(timeline, ratio, rate=50, lookahead=0.1)
+    expected = show.sample(timeline, ratio, 50, 0.1)
+
+    assert np.array_equal(show.play(data), expected)
+    assert expected.shape == (int(timeline.frames / ratio * 50), 2)
+
+
+def test_encoding_covers_long_runs_and_jumps():
+    """Runs longer than a code holds and jumps beyond a delta decode exactly."""
+    angles = np.array([90] * 300 + [91, 60, 180, 0, 0, 31, 0] + [45] * 129, dtype=np.int16)
+    stream = show.encode_stream(angles)
+    data = (
+        show.HEADER.pack(show.MAGIC, show.VERSION, 25, 1, len(angles))
+        + show.CHANNEL.pack(0, show.HEADER.size + show.CHANNEL.size) + stream
+    )
+
+    assert np.array_equal(show.play(data)[:, 0], angles)
+
+
+def test_multi_minute_show_fits_uno():
+    """Five minutes at the default control rate fit in the flash an Uno leaves free."""
+    ratio = 22050 / 512
+    data = show.compile_show(make_timeline(300, ratio), ratio)
+    assert len(data) < 24 * 1024
@@ -0,0 +1,78 @@
+import numpy as np
+
+from app.state import state
+from app.timeline import Timeline
+from app.utils.arduino import get_rotations
+from app.utils.channels import Channel
+from app.utils.maths import AllowedRotations
+
+
+def reference_rotation(db: float) -> int:
+    """The per call rotation computed before the lookup table, truncated like the firmware."""
+    rotation_step = (state.rotations_range[1] - state.rotations_range[0]) / (state.min_dbfs - state.max_dbfs)
+    rotation = state.rotations_range[1] + (state.max_dbfs - db) * rotation_step
+
+    allowed = list(state.allowed_rotations)
+    closest = allowed[min(range(len(allowed)), key=lambda i: abs(allowed[i] - rotation))] if allowed else rotation
+    if state.rotations_range[0] <= closest <= state.rotations_range[1]:
+        return int(closest)
+
+    if rotation < state.rotations_range[0]:
+        return state.rotations_range[0]
+
+    if rotation > state.rotations_range[1]:
+        return state.rotations_range[1]
+
+    return int(rotation - (rotation % 5))
+
+
+def test_timeline_matches_reference_rotation(monkeypatch):
+    """The timeline holds the rotation of every frame's average dB."""
+    monkeypatch.setattr(state, "rotations_range", (20, 160))
+    monkeypatch.setattr(state, "allowed_rotations", AllowedRotations([30, 90, 175]))
+    monkeypatch.setattr(state, "min_dbfs", -70)
+    monkeypatch.setattr(state, "max_dbfs", -20)
+
+    spectrogram = np.random.default_rng(0).integers(-80, 0, (300, 80), dtype=np.int8)
+    timeline = Timeline()
+    timeline.update(spectrogram, 100)
+    timeline.update(spectrogram, 300)
+
+    for frame in range(300):
+        db, angle = timeline.get(frame)
+        assert angle == reference_rotation(float(np.mean(spectrogram[frame], dtype=np.float64)))
+
+
+def test_timeline_follows_profile_changes(monkeypatch):
+    """Changing the profile recomputes every analysed frame."""
+    monkeypatch.setattr(state, "allowed_rotations", AllowedRotations())
+    monkeypatch.setattr(state, "rotations_range", (0, 180))
+    spectrogram = np.full((10, 80), -50, dtype=np.int8)
+
+    timeline = Timeline()
+    timeline.update(spectrogram, 10)
+    before = timeline.get(5)[1]
+
+    state.allowed_rotations.add(0)
+    timeline.update(spectrogram, 10)
+
+    assert before != 0 and timeline.get(5)[1] == 0
+    assert timeline.get(10) == timeline.silence
+
+
+def test_timeline_drives_every_channel(monkeypatch):
+    """Every channel follows the average of its own band, within its own range and allowed rotations."""
+    brow = Channel("brow", 0, 1, (100, 1000), (40, 120), AllowedRotations([50, 100]))
+    head = Channel("head", 1, 0, (4000, 8100), (0, 90))
+    monkeypatch.setattr(state, "channels", [brow, head])
+
+    spectrogram = np.random.default_rng(1).integers(-80, 0, (200, 80), dtype=np.int8)
+    timeline = Timeline()
+    timeline.update(spectrogram, 200)
+
+    for index, channel in enumerate(state.get_channels()):
+        db = np.mean(spectrogram[:, channel.get_mask()], axis=1, dtype=np.float64)
+        expected = get_rotations(db, channel.rotations_range, channel.allowed_rotations)
+        assert np.array_equal(timeline.angles[:, index], expected)
+
+    assert len(timeline.get_angles(0)) == 3 and timeline.get_angles(200) is timeline.silent_angles
@@ -0,0 +1,61 @@
+import librosa
+import numpy as np
+import soundfile
+
+from app.utils import analysis
+
+
+def test_stft_blocks_match_full_stft():
+    """Analysing a signal in blocks gives the same frames as a single centered STFT."""
+    n_fft, hop_length = 1024, 256
+    time_series = np.random.default_rng(0).standard_normal(10000).astype(np.float32)
+
+    expected = np.abs(librosa.stft(time_series, n_fft=n_fft, hop_length=hop_length, pad_mode="constant"))
+
+    padded = analysis.pad(time_series, n_fft)
+    frames = analysis.frame_count(len(time_series), hop_length)
+    blocks = [
+        analysis.stft_block(padded, start, min(start + 7, frames), n_fft, hop_length)
+        for start in range(0, frames, 7)
+    ]
+
+    assert frames == expected.shape[1]
+    np.testing.assert_allclose(np.concatenate(blocks, axis=1), expected, rtol=1e-4, atol=1e-4)
+
+
+def test_full_scale_sine_is_zero_dbfs():
+    """A full scale sine sums to 0 dBFS in its band regardless of the rest of the track."""
+    n_fft, sample_rate = 2048, 22050
+    frequencies = np.arange(100, 8100, 100)
+    sine = np.sin(2 * np.pi * 1000 * np.arange(n_fft * 4) / sample_rate).astype(np.float32)
+
+    matrix = analysis.band_matrix(sample_rate, frequencies, n_fft)
+    db = analysis.band_dbfs(analysis.stft_block(analysis.pad(sine, n_fft), 2, 3, n_fft, 512), matrix, n_fft)
+
+    assert db.dtype == np.int8 and db.shape == (1, len(frequencies))
+    assert abs(int(db[0, 9])) <= 1  # The 1000 Hz band.
+    assert db.min() >= -80
+
+
+def test_band_matrix_assigns_each_bin_once():
+    """Every bin between the outer edges belongs to exactly one band."""
+    frequencies = np.arange(100, 8100, 100)
+    matrix = analysis.band_matrix(22050, frequencies, 8192)
+    bins = np.arange(matrix.shape[0]) * 22050 / 8192
+
+    inside = (bins >= 50) & (bins < 8050)
+    assert np.array_equal(matrix.sum(axis=1), inside.astype(np.float32))
+
+
+def test_load_downmixes_and_resamples(tmp_path):
+    """Stereo files are decoded to float32 mono at the requested sample rate."""
+    stereo = np.random.default_rng(0).uniform(-0.5, 0.5, (44100, 2)).astype(np.float32)
+    soundfile.write(str(tmp_path / "stereo.wav"), stereo, 44100)
+
+    time_series, sample_rate = analysis.load(str(tmp_path / "stereo.wav"), None)
+    assert sample_rate == 44100 and time_series.dtype == np.float32
+    np.testing.assert_allclose(time_series, stereo.mean(axis=1), atol=1e-4)
+
+    time_series, sample_rate = analysis.load(str(tmp_path / "stereo.wav"), 22050)
+    assert sample_rate == 22050 and time_series.dtype == np.float32
+    assert abs(len(time_series) - 22050) <= 1
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from app.core import constants
+from app.utils.clock import Jitter, PlaybackClock, get_lookahead
+
+
+def test_clock_smooths_coarse_mixer_position():
+    """The clock runs smoothly between the mixer's steps and converges to its average position."""
+    clock = PlaybackClock()
+    step = 512 / 44100
+
+    positions, times = [], np.arange(0, 10, 1 / 60)
+    for now in times:
+        # The mixer position only advances by whole audio buffers, and its clock runs 0.1% fast.
+        positions.append(clock.update(np.floor(now * 1.001 / step) * step, now))
+
+    assert np.all(np.diff(positions) > 0)
+    assert abs(positions[-1] - times[-1] * 1.001) < step
+
+
+def test_clock_resyncs_on_seek():
+    """Jumps of the mixer position are followed at once."""
+    clock = PlaybackClock()
+    clock.update(1.0, 0.0)
+
+    assert clock.update(30.0, 0.1) == 30.0
+    assert clock.update(-1, 0.2) == -1 and clock.anchor_position is None
+
+
+def test_jitter_stats():
+    """The intervals between events are reported in milliseconds."""
+    jitter = Jitter(size=4)
+    for now in (0.0, 0.01, 0.02, 0.04, 0.05, 0.06):
+        jitter.record(now)
+
+    stats = jitter.get_stats()
+    assert stats["mean"] == pytest.approx(12.5)
+    assert stats["max"] == pytest.approx(7.5)
+
+
+def test_lookahead_subtracts_the_audio_buffer():
+    """The serial and servo delays add to the lookahead, the audio still in the mixer buffer takes away from it."""
+    buffer = constants.latency.mixer_buffer / 44100
+
+    assert get_lookahead(44100, 0.01) == pytest.approx(0.01 + constants.latency.servo - buffer)
+    assert get_lookahead(44100, 0.02) - get_lookahead(44100, 0.01) == pytest.approx(0.01)
+    assert get_lookahead(22050, 0.01) < get_lookahead(44100, 0.01)
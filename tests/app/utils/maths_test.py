@@ -0,0 +1,24 @@
+from app.utils.maths import AllowedRotations
+
+
+def test_nearest_allowed_rotation():
+    """Every angle maps to its nearest allowed rotation, ties go to the lower one."""
+    allowed = AllowedRotations([10, 20, 170])
+
+    assert allowed.nearest[0] == 10
+    assert allowed.nearest[15] == 10
+    assert allowed.nearest[16] == 20
+    assert allowed.nearest[180] == 170
+    assert allowed.snap(24, 5) == 20 and allowed.snap(26, 5) == 26
+
+
+def test_toggle_rotation():
+    """Toggling adds and removes a rotation and bumps the version."""
+    allowed = AllowedRotations()
+    version = allowed.version
+
+    allowed.toggle(45)
+    assert 45 in allowed and list(allowed) == [45] and allowed.version > version
+
+    allowed.toggle(45)
+    assert 45 not in allowed and not allowed and allowed.snap(44, 5) == 44
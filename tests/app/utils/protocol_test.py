@@ -0,0 +1,31 @@
+from app.utils import protocol
+from app.utils.protocol import Parser
+
+
+def test_round_trip():
+    """Every channel and value decodes to what was encoded, even when fed a byte at a time."""
+    frames = [(channel, value) for channel in (0, 1, 15, protocol.CHANNEL_BAUD) for value in range(256)]
+    data = b"".join(protocol.encode(channel, value) for channel, value in frames)
+
+    assert Parser().parse(data) == frames
+
+    parser = Parser()
+    assert [frame for byte in data for frame in parser.feed(bytes([byte]))] == frames
+
+
+def test_parser_resyncs_after_noise():
+    """Noise and corrupted frames are skipped and counted, the following frames still decode."""
+    corrupted = bytearray(protocol.encode(0, 90))
+    corrupted[2] ^= 0x01
+
+    parser = Parser()
+    frames = parser.parse(b"servo,90\n" + bytes(corrupted) + protocol.encode(0, 120) + protocol.encode(1, 45))
+
+    assert frames == [(0, 120), (1, 45)]
+    assert parser.errors == 1
+
+
+def test_baud_request():
+    """Baud rates are requested by their index in the table the firmware shares."""
+    channel, value = Parser().parse(protocol.encode_baud(115200))[0]
+    assert channel == protocol.CHANNEL_BAUD and value == 4
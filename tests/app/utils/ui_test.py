@@ -0,0 +1,59 @@
+import pygame
+
+from app.core import constants
+from app.state import state
+from app.utils.ui import Animation, DirtyRegion, TextCache, get_font
+
+
+def test_text_cache_reuses_rendered_texts():
+    """Texts are rendered once, fonts loaded once, and the least recently used texts are dropped."""
+    pygame.font.init()
+    cache = TextCache(2)
+    font = constants.fonts.roboto_bold
+
+    text = cache.render("-10", font, 12, (0, 0, 0))
+    assert cache.render("-10", font, 12, (0, 0, 0)) is text
+    assert get_font(font, 12) is get_font(font, 12)
+
+    cache.render("-20", font, 12, (0, 0, 0))
+    cache.render("-30", font, 12, (0, 0, 0))
+
+    assert ("-10", font, 12, (0, 0, 0), True) not in cache.surfaces
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 3
+
+
+def test_dirty_region_changes_with_its_key_and_the_mouse():
+    """A region is dirty when its key changes, or when the mouse moves or clicks inside it."""
+    region = DirtyRegion(pygame.Rect(0, 0, 100, 100))
+    state.mouse_pos, state.holding_mouse = (200, 200), False
+
+    assert region.check(1) == [region.rect]
+    assert region.check(1) == []
+
+    state.mouse_pos = (300, 300)
+    assert region.check(1) == []
+
+    state.mouse_pos = (50, 50)
+    assert region.check(1) == [region.rect]
+
+    state.holding_mouse = True
+    assert region.check(1) == [region.rect]
+    assert region.check(1) == []
+
+    state.mouse_pos, state.holding_mouse = (0, 0), False
+
+
+def test_animation_frames_follow_the_time():
+    """The frames are decoded once into an atlas, and picked from the time."""
+    animation = Animation(constants.animations.loading, 0.03)
+    assert animation.atlas is None
+
+    rect = animation.get_rect(1, (100, 100))
+    assert rect.center == (100, 100)
+    assert len(animation.frames) == len(constants.animations.loading)
+    assert animation.atlas.get_width() == sum(frame.width for frame in animation.frames)
+
+    assert animation.get_frame(0.0) == 0
+    assert animation.get_frame(0.035) == 1
+    assert animation.get_frame(0.03 * len(animation.frames) + 0.01) == 0
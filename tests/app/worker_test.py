@@ -0,0 +1,60 @@
+import queue
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import soundfile
+
+from app.cache import load_spectrogram
+from app.utils import analysis
+from app.worker import AnalysisJob
+
+
+def make_track(path, seconds: float = 5) -> str:
+    """Writes a noise track and returns its path."""
+    noise = np.random.default_rng(0).uniform(-0.5, 0.5, int(22050 * seconds)).astype(np.float32)
+    soundfile.write(str(path), noise, 22050)
+    return str(path)
+
+
+def test_job_streams_and_caches_spectrogram(tmp_path):
+    """The worker fills the shared spectrogram and caches the same frames as a direct analysis."""
+    track = make_track(tmp_path / "track.wav")
+    job = AnalysisJob(track, str(tmp_path / "cache"))
+    job.start()
+
+    deadline = time.monotonic() + 60
+    while not job.done and not job.error and time.monotonic() < deadline:
+        job.poll()
+
+    expected, _ = analysis.analyse(track)
+    assert job.done and job.analysed_frames == len(expected)
+    assert np.array_equal(job.spectrogram, expected)
+    assert np.array_equal(load_spectrogram(str(tmp_path / "cache"))[0], expected)
+
+    job.close()
+    assert job.spectrogram is None
+
+
+def test_cancelled_job_stops_worker(tmp_path):
+    """Cancelling stops the worker before it writes the cache."""
+    job = AnalysisJob(make_track(tmp_path / "track.wav", 60), str(tmp_path / "cache"))
+    job.start()
+    job.cancel()
+
+    assert not job.process.is_alive()
+    assert not (tmp_path / "cache" / "manifest.json").exists()
+
+
+def test_messages_sent_before_exit_are_read(tmp_path):
+    """A worker that finished and exited while the queue looked empty is done, not failed."""
+    job = AnalysisJob(str(tmp_path / "track.wav"), str(tmp_path / "cache"))
+
+    def get(timeout: float) -> tuple:
+        raise queue.Empty
+
+    job.process = SimpleNamespace(is_alive=lambda: False, exitcode=0)
+    job.messages = SimpleNamespace(get=get, get_nowait=lambda: ("done",))
+    job.poll()
+
+    assert job.done and not job.error